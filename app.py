@@ -1,40 +1,356 @@
-from flask import Flask, render_template, request
-from markupsafe import escape
-from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
+from flask import Flask, Response, abort, before_render_template, g, render_template, request, stream_template, stream_with_context, template_rendered, url_for
+from hashlib import sha1
+from markupsafe import Markup, escape
+import click
+import dataclasses
+import html
+import json
+import os
+import threading
+import time
+import urllib.request
 
+import assets
+import compress
 import db
+import metrics
+import youtube
 from models import Channel
+from videos import canonical_video_key
 
 app = Flask(__name__)
+# Settings like DATABASE can come from FLASK_-prefixed environment variables.
+app.config.from_prefixed_env()
 db.init_app(app)
 
+# Rendered pages, keyed by route and canonical query args.
+page_cache = db.ResultCache(maxsize=app.config.get('PAGE_CACHE_SIZE', 512), ttl=app.config.get('PAGE_CACHE_TTL', 300))
+# Send the home and search pages as they render, reading VODs straight off
+# the cursor, instead of rendering them whole first. On by default, which
+# leaves freshly rendered pages without a Server-Timing header.
+stream_pages = app.config.get('STREAM_PAGES', True)
+# Streamed pages are sent in pieces of at least this many characters.
+STREAM_CHUNK_SIZE = 4096
+# gzip or brotli compress HTML and JSON responses for clients that accept it.
+compress_responses = app.config.get('COMPRESS_RESPONSES', True)
+# Smaller bodies are sent as they are.
+COMPRESS_MIN_SIZE = 1024
+COMPRESSED_TYPES = {'text/html', 'application/json', 'application/x-ndjson'}
+# Fingerprinted files can be cached for good, since a change gets a new name.
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+asset_registry = assets.AssetRegistry(
+    os.path.join(app.root_path, app.template_folder, 'styles.css'),
+    os.path.join(app.root_path, 'static/icons')
+)
+
+request_duration = metrics.Histogram('vods_request_seconds', 'Time to handle each request, by route.', ('route', 'method'))
+request_queries = metrics.Histogram('vods_request_sql_queries', 'SQL statements run per request, by route.', ('route',), buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+render_duration = metrics.Histogram('vods_template_render_seconds', 'Time to render each template.', ('template',))
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.render_seconds = 0.0
+    db.start_query_stats()
+
+@before_render_template.connect_via(app)
+def start_render_timing(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timing(sender, template, context, **extra):
+    elapsed = time.perf_counter() - g.render_start
+    g.render_seconds += elapsed
+    render_duration.observe(elapsed, template.name)
+
+@app.after_request
+def add_server_timing(response):
+    """Record the request's timings and report them in a Server-Timing header.
+
+    Streamed responses are recorded once their body has been sent, which is
+    too late for a header, so they go without.
+    """
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if response.is_streamed:
+        response.response = record_timing_when_sent(response.response, g._get_current_object(), route, request.method)
+        return response
+    timing = record_timing(g, route, request.method)
+    if timing is None:
+        return response
+    stats, elapsed = timing
+    response.headers['Server-Timing'] = ', '.join([
+        f'sql;dur={stats.seconds * 1000:.2f};desc="{stats.queries} queries, {stats.rows} rows"',
+        f'render;dur={g.render_seconds * 1000:.2f}',
+        f'total;dur={elapsed * 1000:.2f}',
+    ])
+    return response
+
+def record_timing(request_globals, route, method):
+    """Observe a finished request's duration and query count, returning (stats, seconds)."""
+    stats = db.stop_query_stats()
+    if stats is None:
+        return None
+    elapsed = time.perf_counter() - request_globals.request_start
+    request_duration.observe(elapsed, route, method)
+    request_queries.observe(stats.queries, route)
+    return stats, elapsed
+
+def record_timing_when_sent(chunks, request_globals, route, method):
+    # The body's queries run on this thread as it's sent, so they still count
+    # towards the request's stats until it's done.
+    try:
+        yield from chunks
+    finally:
+        record_timing(request_globals, route, method)
+
+def response_encoding():
+    if not compress_responses:
+        return None
+    return compress.pick_encoding(request.accept_encodings)
+
+@app.after_request
+def compress_response(response):
+    """Compress HTML and JSON responses that cached_page hasn't already."""
+    if (response.mimetype not in COMPRESSED_TYPES or response.status_code != 200
+            or 'Accept-Encoding' in response.vary or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = response_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress.compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress.compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def get_site_version():
+    """Return (tag, mtime) covering the templates, static assets and channel list.
+
+    The files are looked at once, and again on each request only while
+    templates auto-reload, as they do in debug mode.
+    """
+    if app.jinja_env.auto_reload:
+        read_site_version.cache_clear()
+    return read_site_version()
+
+@lru_cache(maxsize=1)
+def read_site_version():
+    paths = [os.path.join(app.template_folder, name) for name in sorted(os.listdir(app.template_folder))]
+    paths += asset_registry.sources()
+    paths.append('data/channel_ids.txt')
+    mtimes = [os.stat(os.path.join(app.root_path, path)).st_mtime for path in paths]
+    tag = sha1(repr(mtimes).encode()).hexdigest()[:12]
+    return tag, datetime.fromtimestamp(int(max(mtimes)), timezone.utc)
+
+def cached_page(key, render, mimetype='text/html'):
+    """Serve a page from the page cache, or a 304 if the client's copy is current.
+
+    Pages only change when the database's write generation or the site files
+    change, so those make up the ETag and Last-Modified. Compressed copies
+    are cached alongside the page.
+    """
+    generation, updated_at = db.get_write_state()
+    site_tag, site_modified = get_site_version()
+    updated_at = updated_at.replace(tzinfo=timezone.utc)
+    encoding = response_encoding()
+
+    response = Response(mimetype=mimetype)
+    response.set_etag(sha1(repr((generation, site_tag, key, encoding)).encode()).hexdigest())
+    response.last_modified = max(updated_at, site_modified)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    page_key = (site_tag, key)
+    if encoding:
+        body = page_cache.get((page_key, encoding), generation)
+        if body is not None:
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+            return response
+    html = page_cache.get(page_key, generation)
+    if html is None:
+        html = render()
+        if not isinstance(html, str):
+            response.response = stream_into_cache(html, page_key, generation)
+            if encoding:
+                response.response = compress.compress_stream(response.response, encoding)
+                response.headers['Content-Encoding'] = encoding
+            # make_conditional sized the empty body.
+            del response.headers['Content-Length']
+            return response
+        page_cache.put(page_key, generation, html)
+    body = html.encode()
+    if encoding and len(body) >= COMPRESS_MIN_SIZE:
+        body = compress.compress(body, encoding)
+        page_cache.put((page_key, encoding), generation, body)
+        response.headers['Content-Encoding'] = encoding
+    response.set_data(body)
+    return response
+
+def stream_into_cache(chunks, page_key, generation):
+    """Pass a streamed page on in STREAM_CHUNK_SIZE pieces, caching it once it's all been sent."""
+    parts = []
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE:
+            parts += buffer
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    parts += buffer
+    yield ''.join(buffer)
+    page_cache.put(page_key, generation, ''.join(parts))
+
+def load_channels(path):
+    return tuple(Channel(url=url, name=name) for url, _, name in youtube.read_channel_ids(path))
+
+class ChannelRegistry:
+    """The channels in a channel list file, reloaded when the file changes while templates auto-reload.
+
+    The credits fragment listing them is rendered once per version of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.channels = ()
+        self.html = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.mtime is not None and not app.jinja_env.auto_reload:
+            return self.channels
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    self.channels = load_channels(self.path)
+                    self.html = None
+                    self.mtime = mtime
+        return self.channels
+
+    def credits_html(self):
+        channels = self.get()
+        html = self.html
+        if html is None:
+            html = self.html = Markup(app.jinja_env.get_template('credits.jinja2').render(channels=channels))
+        return html
+
+channel_registry = ChannelRegistry(os.path.join(app.root_path, 'data/channel_ids.txt'))
+
 def get_channels():
-    channels = []
-    with open('data/channel_ids.txt') as f:
-        for line in f.readlines():
-            url, rest = line.split(': ')
-            _, name = rest.split(' ')[0], rest.split(' ')[1:]
-            name = ' '.join(name)
-            channels.append(Channel(url=url, name=name))
-    return channels
+    return channel_registry.get()
+
+@app.context_processor
+def inject_credits():
+    return {'credits_html': channel_registry.credits_html()}
+
+@app.context_processor
+def inject_assets():
+    names, _, icons = asset_registry.get(reload=app.jinja_env.auto_reload)
+    sprite_url = url_for('asset', name=names['icons.svg']) if 'icons.svg' in names else None
+
+    def asset_url(name):
+        return url_for('asset', name=names[name])
+
+    return {'asset_url': asset_url, 'character_icons': character_icon_tags(sprite_url, icons)}
+
+class CharacterIconTags(dict):
+    """{icon_url: tag} for the VOD table, an icon from the sprite or the original image if it isn't in there."""
+
+    def __init__(self, sprite_url, icons):
+        super().__init__()
+        self.sprite_url = sprite_url
+        self.icons = icons
+
+    def __missing__(self, icon_url):
+        name = assets.icon_name(icon_url)
+        if self.sprite_url and name in self.icons:
+            tag = Markup('<svg width="24" height="24"><use href="{}#{}"/></svg>').format(self.sprite_url, name)
+        else:
+            tag = Markup('<img src="{}" width="24" height="24"/>').format(icon_url)
+        self[icon_url] = tag
+        return tag
+
+@lru_cache(maxsize=8)
+def character_icon_tags(sprite_url, icons):
+    # Looked up rather than called from the template, which is quicker per row.
+    return CharacterIconTags(sprite_url, icons)
+
+@app.route("/assets/<name>")
+def asset(name):
+    """Serve a fingerprinted file, precompressed if the client accepts it."""
+    _, files, _ = asset_registry.get(reload=app.jinja_env.auto_reload)
+    if name not in files:
+        abort(404)
+    mimetype, variants = files[name]
+    encoding = response_encoding()
+    response = Response(variants[encoding] if encoding else variants[None], mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = ASSET_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+# The links canonical_video_key recognizes, for the submission form's error.
+SUBMISSION_URL_FORMS = ("Accepted links are YouTube videos (youtube.com/watch?v=..., youtu.be/..., and "
+                        "youtube.com/shorts/..., /live/... or /embed/...), YouTube playlists "
+                        "(youtube.com/playlist?list=...), Twitch VODs (twitch.tv/videos/...) and Twitch clips. "
+                        "Channel pages and other links aren't.")
 
 def validate_submission_input(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date):
     if not url:
         return "Need a URL."
     if len(url) <= 0:
         return "URL must be non-empty."
-    netloc = urlparse(url).netloc
-    if netloc.replace('www.', '') not in ['youtube.com', 'twitch.tv']:
-        return "Only YouTube and Twitch VODs are accepted for now."
+    # The form fields arrive HTML-escaped.
+    url = html.unescape(url)
+    platform, _ = canonical_video_key(url)
+    if platform == 'url':
+        return f"That link isn't to a YouTube or Twitch video. {SUBMISSION_URL_FORMS}"
+    if db.vod_exists(url):
+        return "That VOD is already on the site."
     return None
 
+def page_urls(page, **args):
+    """Return the (newer, older) links for a page of VODs."""
+    args = {name: value for name, value in args.items() if value}
+    prev_url = url_for(request.endpoint, **args, cursor=page.prev_cursor) if page.prev_cursor else None
+    next_url = url_for(request.endpoint, **args, cursor=page.next_cursor) if page.next_cursor else None
+    return prev_url, next_url
+
 @app.route("/")
 def home_page():
-    latest_vods = list(db.latest_vods())
-    return render_template("home.jinja2", vods=latest_vods, channels=get_channels(), is_search=False)
+    cursor = request.args.get('cursor') or None
 
-@app.route("/search")
-def search_page():
+    def render():
+        if stream_pages:
+            page = db.stream_vods(cursor=cursor)
+            return stream_template("home.jinja2", vods=page, pager=lambda: page_urls(page), is_search=False)
+        page = db.latest_vods(cursor=cursor)
+        return render_template("home.jinja2", vods=page.vods, pager=lambda: page_urls(page), is_search=False)
+    return cached_page(('home', cursor), render)
+
+def search_args():
     p1 = request.args.get('p1') or ''
     p2 = request.args.get('p2') or ''
     c1 = request.args.get('c1')
@@ -44,20 +360,89 @@ def search_page():
     if not c2 or c2.lower() == 'any':
         c2 = ''
     event = request.args.get('event') or ''
+    return p1, p2, c1, c2, event
+
+@app.route("/search")
+def search_page():
+    p1, p2, c1, c2, event = search_args()
+    cursor = request.args.get('cursor') or None
+
+    def render():
+        if stream_pages:
+            page = db.stream_vods(p1, p2, c1, c2, event, cursor=cursor)
+            vods = page
+            template = stream_template
+        else:
+            page = db.search_vods(p1, p2, c1, c2, event, cursor=cursor)
+            vods = page.vods
+            template = render_template
+        pager = lambda: page_urls(page, p1=p1, p2=p2, c1=c1, c2=c2, event=event)
+        return template("home.jinja2", vods=vods, pager=pager, c1=c1, c2=c2, p1=p1, p2=p2, event=event, is_search=True)
+    return cached_page(('search', p1, p2, c1, c2, event, cursor), render)
+
+@app.route("/api/vods")
+@app.route("/api/search")
+def vods_api():
+    """Stream the VODs matching a search as newline-delimited JSON.
+
+    Takes the same arguments as /search, plus an optional `limit`. Every line
+    has a `cursor`; pass the last one back as `cursor` to continue from there.
+    """
+    p1, p2, c1, c2, event = search_args()
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', type=int)
+
+    def generate():
+        for vod in db.iter_vods(p1, p2, c1, c2, event, cursor=cursor, limit=limit):
+            yield json.dumps(vod) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-    search_results = list(db.search_vods(p1, p2, c1, c2, event))
+@app.route("/api/suggest")
+def suggest_api():
+    """Return the player tags or event names starting with `q` as a JSON list.
 
-    return render_template("home.jinja2", vods=search_results, c1=c1, c2=c2, p1=p1, p2=p2, event=event, channels=get_channels(), is_search=True)
+    `field` is p1, p2 or event.
+    """
+    field = 'event' if request.args.get('field') == 'event' else 'player'
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return Response(json.dumps(db.suggest(field, request.args.get('q') or '', limit)), mimetype='application/json')
 
+@app.route("/stats")
+def stats_page():
+    return cached_page(('stats',), lambda: render_template("stats.jinja2", stats=db.get_stats()))
+
+@app.route("/api/stats")
+def stats_api():
+    return cached_page(('api-stats',), lambda: json.dumps(dataclasses.asdict(db.get_stats())), mimetype='application/json')
+
+@app.route("/metrics")
+def metrics_page():
+    """Request, SQL, rendering and cache metrics for this process, in the Prometheus text format."""
+    cache_hits = metrics.Counter('vods_cache_hits_total', 'Cache lookups that found an entry.', ('cache',))
+    cache_misses = metrics.Counter('vods_cache_misses_total', "Cache lookups that didn't find an entry.", ('cache',))
+    cache_evictions = metrics.Counter('vods_cache_evictions_total', 'Entries dropped from a cache.', ('cache',))
+    cache_size = metrics.Gauge('vods_cache_entries', 'Entries in a cache.', ('cache',))
+    for name, cache in (('result', db.result_cache), ('page', page_cache)):
+        stats = cache.stats()
+        cache_hits.inc(stats['hits'], name)
+        cache_misses.inc(stats['misses'], name)
+        cache_evictions.inc(stats['evictions'], name)
+        cache_size.set(stats['size'], name)
+    body = metrics.render([
+        request_duration, request_queries, render_duration, db.sql_duration, db.sql_rows,
+        cache_hits, cache_misses, cache_evictions, cache_size, db.replica_refreshes,
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 @app.post("/submission")
 def vod_post():
     url = escape(request.form['url']) if 'url' in request.form else None
-    p1_char = escape(request.form['p1_char']) if 'p1_char' in request.form else None
+    # The form's fields are p1_character and p2_character.
+    p1_char = escape(request.form['p1_character']) if 'p1_character' in request.form else None
     if p1_char == 'none':
         p1_char = None
     p1_tag = escape(request.form['p1_tag']) if 'p1_tag' in request.form else None
-    p2_char = escape(request.form['p2_char']) if 'p2_char' in request.form else None
+    p2_char = escape(request.form['p2_character']) if 'p2_character' in request.form else None
     if p2_char == 'none':
         p2_char = None
     p2_tag = escape(request.form['p2_tag']) if 'p2_tag' in request.form else None
@@ -67,6 +452,130 @@ def vod_post():
 
     error = validate_submission_input(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)
     if not error:
-        db.create_submission(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)
-        return render_template('submission_success.jinja2')
-    return render_template('submission_fail.jinja2')
+        # Written to the database in the background, so a burst of
+        # submissions doesn't queue up on the write lock.
+        if db.submission_queue.put((url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)):
+            return render_template('submission_success.jinja2')
+        error = "Too many submissions right now, please try again in a minute."
+        return render_template('submission_fail.jinja2', error=error), 503, {'Retry-After': '60'}
+    return render_template('submission_fail.jinja2', error=error)
+
+def static_pages(characters):
+    """Return {file: url} for the pages build-static renders."""
+    pages = {'index.html': '/'}
+    for c1 in characters:
+        for c2 in characters:
+            pages[f'search/{c1}/{c2}.html'] = f'/search?c1={c1}&c2={c2}'
+    return pages
+
+def matchup_shows(c1, c2, vod_c1, vod_c2):
+    """Whether the search for characters c1 and c2 ('any' for either) lists a vod_c1 vs vod_c2 VOD."""
+    if c1 == c2 != 'any':
+        return vod_c1 == vod_c2 == c1
+    return all(c == 'any' or c in (vod_c1, vod_c2) for c in (c1, c2))
+
+def render_static_page(output, path, url):
+    response = app.test_client().get(url)
+    if response.status_code != 200:
+        raise click.ClickException(f'{url} returned {response.status}')
+    body = response.get_data()
+    variants = [('', body)]
+    variants += [(compress.SUFFIXES[encoding], data) for encoding, data in compress.precompressed(body).items()]
+
+    filename = os.path.join(output, path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    for suffix, data in variants:
+        # Written aside and renamed, so the web server never serves half a file.
+        with open(f'{filename}{suffix}.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(f'{filename}{suffix}.tmp', filename + suffix)
+
+@app.cli.command('build-static')
+@click.option('--output', default='static_site', help='Directory to write the pages to.')
+@click.option('--workers', default=os.cpu_count(), help='Pages to render at once.')
+@click.option('--full', is_flag=True, help='Render every page, not just the ones with new VODs.')
+def build_static_command(output, workers, full):
+    """Render the home page and every character matchup search to files.
+
+    Each page also gets a .gz copy, and a .br copy if brotli is installed, for
+    the web server to serve without Python. The stylesheet and icon sprite go
+    in assets/, after downloading any icons static/icons is missing. build.json in the output records the build, so the next one
+    only re-renders the pages new VODs show up on.
+    """
+    manifest_path = os.path.join(output, 'build.json')
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    if vendor_icons(missing_only=True):
+        read_site_version.cache_clear()
+    with app.app_context():
+        characters = ['any', *db.character_names()]
+        last_id, count, matchups = db.vods_listed_since(manifest.get('last_vod_id', 0))
+    site_tag, _ = get_site_version()
+    pages = static_pages(characters)
+
+    # Template and channel list changes touch every page, and there's no
+    # telling which pages a deleted VOD was on.
+    if (manifest.get('site_tag') != site_tag or manifest.get('brotli') != bool(compress.brotli)
+            or count != manifest.get('vod_count', 0) + sum(matchups.values())):
+        stale = set(pages)
+    else:
+        stale = {path for path in pages if path not in manifest['pages']}
+        if matchups:
+            stale.add('index.html')
+        for c1 in characters:
+            for c2 in characters:
+                if any(matchup_shows(c1, c2, *matchup) for matchup in matchups):
+                    stale.add(f'search/{c1}/{c2}.html')
+
+    paths = sorted(stale)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(render_static_page, [output] * len(paths), paths, [pages[path] for path in paths]))
+
+    asset_registry.write(os.path.join(output, 'assets'))
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({
+            'site_tag': site_tag,
+            'brotli': bool(compress.brotli),
+            'last_vod_id': last_id,
+            'vod_count': count,
+            'pages': sorted(pages),
+        }, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    click.echo(f'Rendered {len(paths)} of {len(pages)} pages to {output} in {time.perf_counter() - start:.1f}s.')
+
+@app.cli.command('vendor-icons')
+def vendor_icons_command():
+    """Download every character's icon_url into static/icons for the icon sprite."""
+    downloaded = vendor_icons()
+    click.echo(f'Downloaded {downloaded} icons into {asset_registry.icon_dir}.')
+
+def vendor_icons(missing_only=False):
+    """Download characters' icon_urls into static/icons, returning how many were downloaded.
+
+    With `missing_only`, icons that are already there are kept.
+    """
+    with app.app_context():
+        icons = db.character_icons()
+    os.makedirs(asset_registry.icon_dir, exist_ok=True)
+    downloaded = 0
+    for name, icon_url in icons:
+        filename = os.path.join(asset_registry.icon_dir, assets.icon_name(icon_url) + '.png')
+        if missing_only and os.path.exists(filename):
+            continue
+        try:
+            with urllib.request.urlopen(icon_url, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            raise click.ClickException(f"Couldn't download {name}'s icon from {icon_url}: {e}")
+        if not data.startswith(b'\x89PNG'):
+            raise click.ClickException(f"{name}'s icon at {icon_url} isn't a PNG.")
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(filename + '.tmp', filename)
+        click.echo(f'{name}: {filename}')
+        downloaded += 1
+    return downloaded
@@ -0,0 +1,88 @@
+import base64
+import os
+import threading
+from hashlib import sha1
+from urllib.parse import urlparse
+
+import compress
+
+ICON_SIZE = 24
+
+def icon_name(icon_url):
+    """Return the sprite symbol for a game_character.icon_url: its file name without the extension."""
+    return os.path.splitext(os.path.basename(urlparse(icon_url or '').path))[0]
+
+def icon_sprite(icons):
+    """Pack {name: PNG data} into one SVG with a <symbol> per icon, for <use href="icons.svg#name">."""
+    symbols = ''.join(
+        f'<symbol id="{name}" viewBox="0 0 {ICON_SIZE} {ICON_SIZE}">'
+        f'<image width="{ICON_SIZE}" height="{ICON_SIZE}" href="data:image/png;base64,{base64.b64encode(data).decode()}"/>'
+        '</symbol>'
+        for name, data in sorted(icons.items())
+    )
+    return f'<svg xmlns="http://www.w3.org/2000/svg">{symbols}</svg>'.encode()
+
+class AssetRegistry:
+    """The stylesheet and the character icon sprite, fingerprinted and precompressed.
+
+    Both are built in memory from their sources, and rebuilt when one of them
+    changes. The sprite packs the PNGs in `icon_dir`, so a page of VODs loads
+    one file instead of an image per character.
+    """
+
+    def __init__(self, styles_path, icon_dir):
+        self.styles_path = styles_path
+        self.icon_dir = icon_dir
+        self.version = None
+        # ({name: fingerprinted name}, {fingerprinted name: (mimetype, {encoding: data})}, icon names)
+        self.built = ({}, {}, frozenset())
+        self.lock = threading.Lock()
+
+    def sources(self):
+        icons = sorted(name for name in os.listdir(self.icon_dir) if name.endswith('.png')) if os.path.isdir(self.icon_dir) else []
+        return [self.styles_path, *(os.path.join(self.icon_dir, name) for name in icons)]
+
+    def get(self, reload=True):
+        """Return the built files, rebuilding them first if `reload` and a source has changed."""
+        if self.version is not None and not reload:
+            return self.built
+        paths = self.sources()
+        version = tuple((path, os.stat(path).st_mtime_ns) for path in paths)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.built = self.build(paths)
+                    self.version = version
+        return self.built
+
+    def build(self, paths):
+        names = {}
+        files = {}
+
+        def add(name, data, mimetype):
+            stem, extension = os.path.splitext(name)
+            fingerprinted = f'{stem}.{sha1(data).hexdigest()[:12]}{extension}'
+            names[name] = fingerprinted
+            files[fingerprinted] = (mimetype, {None: data, **compress.precompressed(data)})
+
+        with open(paths[0], 'rb') as f:
+            add('styles.css', f.read(), 'text/css')
+        icons = {}
+        for path in paths[1:]:
+            with open(path, 'rb') as f:
+                icons[os.path.splitext(os.path.basename(path))[0]] = f.read()
+        if icons:
+            add('icons.svg', icon_sprite(icons), 'image/svg+xml')
+        return names, files, frozenset(icons)
+
+    def write(self, output):
+        """Write the built files and their precompressed copies to `output`."""
+        _, files, _ = self.get()
+        os.makedirs(output, exist_ok=True)
+        for name, (_, variants) in files.items():
+            for encoding, data in variants.items():
+                filename = os.path.join(output, name + compress.SUFFIXES.get(encoding, ''))
+                if not os.path.exists(filename):
+                    with open(filename + '.tmp', 'wb') as f:
+                        f.write(data)
+                    os.replace(filename + '.tmp', filename)
@@ -0,0 +1,252 @@
+"""Benchmarks for the site at synthetic scale.
+
+    python3 bench.py generate 100000 vods_100k.csv
+    python3 bench.py run --size 100000 --output results.json --baseline bench_baseline.json
+
+`generate` extrapolates data/vods.csv to any number of VODs. `run` loads a
+generated archive into a scratch database and times ingest-csv, latest_vods,
+search_vods, page rendering and export-vods, then compares the results with a
+baseline saved by an earlier `run --save-baseline`.
+"""
+import base64
+import csv
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/vods.csv')
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+def generate_vods(size, seed=0, source=SOURCE_CSV):
+    """Yield `size` synthetic CSV rows shaped like `source`.
+
+    The real tags, events, rounds and character picks are kept and padded
+    out with made-up ones so the number of players and events grows with the
+    archive. Players and events follow a Zipf distribution, as in the real
+    data, and players mostly stick to one main character.
+    """
+    rnd = random.Random(seed)
+    with open(source, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if len(row) == 8]
+    scale = max(size / len(rows), 1)
+
+    tag_counts = Counter(tag for row in rows for tag in (row[1], row[3]))
+    sponsors = sorted(set(tag.split(' | ')[0] for tag in tag_counts if ' | ' in tag))
+    names = sorted(set(tag.split(' | ')[-1] for tag in tag_counts))
+    tags = [tag for tag, _ in tag_counts.most_common()]
+    while len(tags) < len(tag_counts) * scale ** 0.8:
+        tag = f'{rnd.choice(names)}{rnd.randrange(1000)}'
+        if rnd.random() < len(sponsors) / len(names):
+            tag = f'{rnd.choice(sponsors)} | {tag}'
+        tags.append(tag)
+
+    characters = [row[2] for row in rows] + [row[4] for row in rows]
+    mains = {tag: rnd.choice(characters) for tag in tags}
+
+    event_counts = Counter(row[5] for row in rows)
+    series = sorted(set(re.sub(r'\s*#?\d+$', '', event) for event in event_counts))
+    events = [event for event, _ in event_counts.most_common()]
+    while len(events) < len(event_counts) * scale ** 0.9:
+        events.append(f'{rnd.choice(series)} #{rnd.randrange(1000, 100000)}')
+    # Spread the events over time, a few days apart.
+    start = datetime(2024, 1, 1)
+    event_dates = {event: start + timedelta(days=rnd.uniform(0, 450 * scale ** 0.5)) for event in events}
+
+    rounds = [row[6] for row in rows]
+    tag_weights = zipf_weights(len(tags))
+    event_weights = zipf_weights(len(events))
+    chunk_size = 10000
+    for offset in range(0, size, chunk_size):
+        n = min(chunk_size, size - offset)
+        p1s = rnd.choices(tags, tag_weights, k=n)
+        p2s = rnd.choices(tags, tag_weights, k=n)
+        for p1, p2, event in zip(p1s, p2s, rnd.choices(events, event_weights, k=n)):
+            c1 = mains[p1] if rnd.random() < 0.75 else rnd.choice(characters)
+            c2 = mains[p2] if rnd.random() < 0.75 else rnd.choice(characters)
+            vod_date = event_dates[event] + timedelta(minutes=rnd.randrange(3 * 24 * 60))
+            url = 'https://www.youtube.com/watch?v=' + base64.urlsafe_b64encode(rnd.randbytes(8)).decode()[:11]
+            yield [url, p1, c1, p2, c2, event, rnd.choice(rounds), vod_date.strftime('%Y-%m-%d %H:%M:%S+00:00')]
+
+def write_vods(filename, size, seed=0):
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(generate_vods(size, seed))
+
+def summarize(samples):
+    """Return timing percentiles in milliseconds."""
+    samples = sorted(sample * 1000 for sample in samples)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        'n': len(samples),
+        'mean': statistics.fmean(samples),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': samples[-1],
+    }
+
+def time_calls(function, repeat):
+    # One untimed call first so template compiles and cold caches don't count.
+    function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def search_mixes(filename):
+    """Pick search arguments from a generated archive covering the usual filter mixes."""
+    with open(filename, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    tags = Counter(tag for row in rows for tag in (row[1], row[3])).most_common()
+    pairs = Counter((row[1], row[3]) for row in rows if row[1] != row[3]).most_common(1)
+    events = Counter(row[5] for row in rows).most_common()
+    common_tag = tags[0][0]
+    rare_tag = tags[-1][0]
+    p1, p2 = pairs[0][0] if pairs else (common_tag, rare_tag)
+    return {
+        'character': ('', '', 'clairen', '', ''),
+        'matchup': ('', '', 'clairen', 'fleet', ''),
+        'common_player': (common_tag, '', '', '', ''),
+        'rare_player': (rare_tag, '', '', '', ''),
+        'head_to_head': (p1, p2, '', '', ''),
+        'player_character': (common_tag, '', 'kragg', '', ''),
+        'event': ('', '', '', '', events[0][0]),
+        'short_term': (common_tag[:2], '', '', '', ''),
+    }
+
+def run_benchmarks(size, seed, repeat, workdir):
+    csv_path = os.path.join(workdir, f'vods_{size}.csv')
+    write_vods(csv_path, size, seed)
+
+    # Caches off, so every call does the real work.
+    os.environ['FLASK_DATABASE'] = os.path.join(workdir, 'bench.db')
+    os.environ['FLASK_SUBMISSION_SPOOL_DIR'] = os.path.join(workdir, 'submission_spool')
+    os.environ['FLASK_RESULT_CACHE_SIZE'] = '0'
+    os.environ['FLASK_PAGE_CACHE_SIZE'] = '0'
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+    import db
+
+    metrics = {}
+    runner = app.test_cli_runner()
+    with app.app_context():
+        db.init_db()
+    start = time.perf_counter()
+    result = runner.invoke(args=['ingest-csv', csv_path])
+    metrics['ingest_csv'] = summarize([time.perf_counter() - start])
+    if result.exit_code != 0:
+        raise click.ClickException(f'ingest-csv failed: {result.output}')
+
+    with app.app_context():
+        metrics['latest_vods'] = time_calls(db.latest_vods, repeat)
+        cursors = [None]
+        for _ in range(20):
+            page = db.latest_vods(cursor=cursors[-1])
+            if not page.next_cursor:
+                break
+            cursors.append(page.next_cursor)
+        metrics['latest_vods_deep'] = time_calls(lambda: db.latest_vods(cursor=cursors[-1]), repeat)
+        for name, args in search_mixes(csv_path).items():
+            metrics[f'search_vods_{name}'] = time_calls(lambda: db.search_vods(*args), repeat)
+
+    client = app.test_client()
+    metrics['render_home'] = time_calls(lambda: client.get('/').get_data(), repeat)
+    metrics['render_search'] = time_calls(lambda: client.get('/search?c1=clairen&c2=fleet').get_data(), repeat)
+
+    export_path = os.path.join(workdir, 'export.csv')
+    metrics['export_vods'] = time_calls(lambda: runner.invoke(args=['export-vods', export_path]), max(1, repeat // 10))
+
+    return {
+        'size': size,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'metrics': metrics,
+    }
+
+def find_regressions(results, baseline, tolerance, min_ms):
+    """Return a message for each metric whose p50 is worse than the baseline's by more than `tolerance`."""
+    regressions = []
+    for name, metric in results['metrics'].items():
+        before = baseline.get('metrics', {}).get(name)
+        if before is None:
+            continue
+        limit = before['p50'] * (1 + tolerance)
+        if metric['p50'] > limit and metric['p50'] - before['p50'] > min_ms:
+            regressions.append(f"{name}: p50 {metric['p50']:.2f}ms, baseline {before['p50']:.2f}ms")
+    return regressions
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.argument('size', type=int)
+@click.argument('filename')
+@click.option('--seed', default=0, help='Random seed; the same seed gives the same file.')
+def generate(size, filename, seed):
+    """Write SIZE synthetic VODs to FILENAME in the vods.csv format."""
+    write_vods(filename, size, seed)
+    click.echo(f'Wrote {size} vods to {filename}.')
+
+@cli.command()
+@click.option('--size', default=10000, help='Number of VODs to benchmark with, e.g. 10000, 100000 or 1000000.')
+@click.option('--seed', default=0, help='Seed for the generated archive.')
+@click.option('--repeat', default=50, help='Timed calls per query benchmark.')
+@click.option('--output', default=None, help='Write the results as JSON here.')
+@click.option('--baseline', default=None, help='Results JSON to compare against.')
+@click.option('--save-baseline', is_flag=True, help='Write the results to --baseline instead of comparing.')
+@click.option('--tolerance', default=0.5, help='Allowed p50 slowdown against the baseline, as a fraction.')
+@click.option('--min-ms', default=2.0, help='Ignore slowdowns smaller than this many milliseconds.')
+def run(size, seed, repeat, output, baseline, save_baseline, tolerance, min_ms):
+    """Time ingest, queries, rendering and export on a synthetic archive."""
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(size, seed, repeat, workdir)
+
+    click.echo(f"{'benchmark':<32} {'n':>4} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for name, metric in results['metrics'].items():
+        click.echo(f"{name:<32} {metric['n']:>4} {metric['p50']:>8.2f}ms {metric['p90']:>8.2f}ms {metric['p99']:>8.2f}ms {metric['max']:>8.2f}ms")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if not baseline:
+        return
+    if save_baseline:
+        with open(baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f'Saved baseline to {baseline}.')
+        return
+
+    with open(baseline, encoding='utf-8') as f:
+        baseline_results = json.load(f)
+    if baseline_results.get('size') != size:
+        raise click.ClickException(f"Baseline is for {baseline_results.get('size')} vods, not {size}.")
+    regressions = find_regressions(results, baseline_results, tolerance, min_ms)
+    for regression in regressions:
+        click.echo(f'Regression: {regression}', err=True)
+    if regressions:
+        sys.exit(1)
+    click.echo(f'No regressions against {baseline}.')
+
+if __name__ == '__main__':
+    cli()
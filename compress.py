@@ -0,0 +1,66 @@
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    # Only gzip is offered without it.
+    brotli = None
+
+# Responses are compressed quickly, files ahead of time as small as possible.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Streamed responses are flushed to the client after about this much input.
+FLUSH_SIZE = 16 * 1024
+# Extensions of the precompressed copies written next to static files.
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+def pick_encoding(accept_encodings):
+    """Return the encoding to send a response in, given the request's Accept-Encoding, or None."""
+    for encoding in encodings():
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks, encoding):
+    """Compress a streamed body.
+
+    The first chunk, normally the page head, is flushed straight away so the
+    browser can start on it. After that output is flushed every FLUSH_SIZE
+    bytes of input, since flushing after every small chunk, like the API's
+    lines, costs more in size than it gains in latency.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    unflushed = FLUSH_SIZE
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = process(chunk)
+        unflushed += len(chunk)
+        if unflushed >= FLUSH_SIZE:
+            data += flush()
+            unflushed = 0
+        if data:
+            yield data
+    yield finish()
+
+def precompressed(data):
+    """Return {encoding: data} for every encoding, compressed as far as it goes."""
+    variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(data)
+    return variants
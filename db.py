@@ -1,9 +1,22 @@
-import sqlite3
+import base64
 import click
-from datetime import datetime
-from flask import current_app, g
+import html
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import current_app, g, has_request_context
 
-from models import Vod
+import metrics
+from models import HeadToHead, PlayerStats, Stats, Vod, VodPage
+from suggest import PrefixIndex
+from videos import canonical_video_key
 
 CHAR_NAME_TO_ID = {
     "clairen": 1,
@@ -29,22 +42,365 @@ APPROVED_STATUS = 3
 
 RIVALS_OF_AETHER_TWO = 1
 
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-           'database.db',
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+class ResultCache:
+    """LRU cache of query results, dropped whenever the write generation moves.
+
+    Entries also expire after `ttl` seconds as a backstop.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self.lock:
+            if self.generation is None or generation > self.generation:
+                self.evictions += len(self.entries)
+                self.entries.clear()
+                self.generation = generation
+            elif generation < self.generation:
+                # A request that read the generation before the last write.
+                self.misses += 1
+                return None
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value):
+        with self.lock:
+            if generation != self.generation or self.maxsize <= 0:
+                return
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+            }
+
+result_cache = ResultCache()
+
+# Connection settings, overridable through the app config in init_app.
+settings = {
+    'DATABASE': 'database.db',
+    'SQLITE_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # Enough for every statement db.py runs, including each search shape.
+    'SQLITE_CACHED_STATEMENTS': 256,
+    # Log statements slower than this, with their query plans. Off when None.
+    'SLOW_QUERY_MS': None,
+    # Form submissions waiting to be written, and where they're spooled until they are.
+    'SUBMISSION_QUEUE_SIZE': 1000,
+    'SUBMISSION_SPOOL_DIR': 'submission_spool',
+    # Write a batch once it has this many submissions, or this long after its first.
+    'SUBMISSION_BATCH_SIZE': 100,
+    'SUBMISSION_FLUSH_SECONDS': 1.0,
+    # Serve requests' reads from an in-memory copy of the database, checked
+    # for changes this often.
+    'READ_REPLICA': False,
+    'READ_REPLICA_POLL_SECONDS': 1.0,
+}
+
+sql_duration = metrics.Histogram('vods_sql_statement_seconds', 'Time spent executing each SQL statement and fetching its rows.')
+sql_rows = metrics.Counter('vods_sql_rows_total', 'Rows fetched or changed by SQL statements.')
+slow_query_log = logging.getLogger('vods.slow_queries')
+replica_refreshes = metrics.Counter('vods_read_replica_refreshes_total', 'Times the database was copied into the in-memory read replica.')
+replica_log = logging.getLogger('vods.read_replica')
+
+class QueryStats:
+    def __init__(self, record=False):
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        # (sql, params) of each statement, for check-plans.
+        self.statements = [] if record else None
+
+# Statement counts and timings for the request this thread is serving.
+request_stats = threading.local()
+
+def start_query_stats(record=False):
+    request_stats.current = QueryStats(record)
+    return request_stats.current
+
+def stop_query_stats():
+    stats = getattr(request_stats, 'current', None)
+    request_stats.current = None
+    return stats
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times each statement, counting the time spent fetching its rows.
+
+    A statement is done once its rows run out, the cursor runs another
+    statement, or the cursor is closed or dropped.
+    """
+    sql = None
+
+    def begin(self, sql, params):
+        self.finish()
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.rows = 0
+        self.logged = False
+        stats = getattr(request_stats, 'current', None)
+        if stats is not None:
+            stats.queries += 1
+            if stats.statements is not None:
+                stats.statements.append((sql, params))
+
+    def record(self, elapsed, rows):
+        self.seconds += elapsed
+        self.rows += rows
+        stats = getattr(request_stats, 'current', None)
+        if stats is not None:
+            stats.seconds += elapsed
+            stats.rows += rows
+        threshold = settings['SLOW_QUERY_MS']
+        if threshold is not None and not self.logged and self.seconds * 1000 >= threshold:
+            self.logged = True
+            log_slow_query(self.connection, self.sql, self.params, self.seconds)
+
+    def finish(self):
+        if self.sql is not None:
+            sql_duration.observe(self.seconds)
+            sql_rows.inc(self.rows)
+            self.sql = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        super().execute(sql, params)
+        elapsed = time.perf_counter() - start
+        self.begin(sql, params)
+        self.record(elapsed, max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        elapsed = time.perf_counter() - start
+        self.begin(sql, None)
+        self.record(elapsed, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.record(time.perf_counter() - start, row is not None)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self.record(time.perf_counter() - start, len(rows))
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.record(time.perf_counter() - start, len(rows))
+        self.finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.record(time.perf_counter() - start, 0)
+            self.finish()
+            raise
+        self.record(time.perf_counter() - start, 1)
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        self.finish()
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+def log_slow_query(db, sql, params, seconds):
+    plan = ''
+    if params is not None:
+        try:
+            # A plain cursor, so this doesn't get timed itself.
+            rows = sqlite3.Cursor(db).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+            plan = '\n'.join(f'  {row[3]}' for row in rows)
+        except sqlite3.Error as e:
+            plan = f'  (no plan: {e})'
+    slow_query_log.warning('%.1fms: %s %r\n%s', seconds * 1000, ' '.join(sql.split()), params, plan)
+
+# Open connections, per thread and per process.
+pool = threading.local()
+
+def connect(readonly=False, database=None):
+    db = sqlite3.connect(
+        database or settings['DATABASE'],
+        factory=TimedConnection,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=settings['SQLITE_CACHED_STATEMENTS'],
+        uri=database is not None
+    )
+    db.row_factory = sqlite3.Row
+    for name, value in settings['SQLITE_PRAGMAS'].items():
+        db.cursor().execute(f"PRAGMA {name} = {value};")
+    if readonly:
+        db.cursor().execute("PRAGMA query_only = ON;")
+    return db
+
+def get_db(readonly=False):
+    """Return this thread's connection, opening it on first use.
+
+    Connections are kept open across requests so each worker thread only
+    pays for setup, schema parsing and cache warmup once. `readonly` gives a
+    separate connection that refuses writes, for the read paths. With
+    READ_REPLICA on, that's a connection to the in-memory replica while
+    serving a request, the same one for the whole request.
+    """
+    if readonly and settings['READ_REPLICA'] and has_request_context():
+        if 'replica_db' not in g:
+            read_replica.start()
+            g.replica_db = get_pooled_db(True, read_replica.uri)
+            # Let go of copies that have been replaced. This thread's last
+            # request has finished streaming by now, unlike at teardown.
+            connections = pool.connections
+            for key in [key for key in connections if key[0].startswith('file:vods-replica-') and key[0] != read_replica.uri]:
+                connections.pop(key).close()
+        return g.replica_db
+    return get_pooled_db(readonly)
+
+def get_pooled_db(readonly, database=None):
+    connections = getattr(pool, 'connections', None)
+    # A forked worker mustn't reuse its parent's connections.
+    if connections is None or pool.pid != os.getpid():
+        connections = pool.connections = {}
+        pool.pid = os.getpid()
+
+    key = (database or settings['DATABASE'], readonly)
+    db = connections.get(key)
+    if db is None:
+        db = connections[key] = connect(readonly, database)
+    return db
 
-    return g.db
+class ReadReplica:
+    """An in-memory copy of the database for this process's requests to read.
+
+    The copy is made with the backup API. A background thread watches the
+    file's data_version, inode and mtime, and when they change makes a new
+    copy under a new name. Requests switch to the new copy as they start,
+    and connections to old copies are closed once their request is done.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.uri = None
+        # Keeps the current copy alive between requests.
+        self.keeper = None
+        self.source = None
+        self.source_inode = None
+        self.state = None
+        self.copies = 0
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # Connections inherited from a parent process can't be used.
+            self.source = self.keeper = None
+            self.refresh()
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def source_state(self):
+        stat = os.stat(settings['DATABASE'])
+        if self.source is None or stat.st_ino != self.source_inode:
+            # The file was replaced, so the old connection would keep reading the old one.
+            if self.source is not None:
+                self.source.close()
+            self.source = sqlite3.connect(settings['DATABASE'], check_same_thread=False)
+            self.source_inode = stat.st_ino
+        data_version = self.source.execute("PRAGMA data_version;").fetchone()[0]
+        return stat.st_ino, stat.st_mtime_ns, data_version
+
+    def refresh(self):
+        state = self.source_state()
+        self.copies += 1
+        uri = f'file:vods-replica-{os.getpid()}-{self.copies}?mode=memory&cache=shared'
+        copy = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.source.backup(copy)
+        keeper = self.keeper
+        self.keeper, self.uri, self.state = copy, uri, state
+        if keeper is not None:
+            keeper.close()
+        replica_refreshes.inc()
+
+    def run(self):
+        while True:
+            time.sleep(settings['READ_REPLICA_POLL_SECONDS'])
+            try:
+                if self.source_state() != self.state:
+                    self.refresh()
+            except Exception:
+                replica_log.exception('Refreshing the read replica failed')
 
 
 def close_db(e=None):
-    db = g.pop('db', None)
+    # The connections stay open for the thread's next request, but nothing
+    # uncommitted should carry over into it.
+    for db in getattr(pool, 'connections', {}).values():
+        if db.in_transaction:
+            db.rollback()
 
-    if db is not None:
+def close_connections():
+    for db in getattr(pool, 'connections', {}).values():
         db.close()
+    pool.connections = {}
+
+read_replica = ReadReplica()
 
 def init_db():
     db = get_db()
@@ -52,6 +408,74 @@ def init_db():
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
 
+def run_script(db, filename):
+    """Run the statements in a SQL file one at a time.
+
+    Unlike executescript this doesn't commit first, so the file runs inside
+    the caller's transaction.
+    """
+    with current_app.open_resource(filename) as f:
+        script = f.read().decode('utf8')
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            db.cursor().execute(statement)
+            statement = ''
+
+def migrate_read_tables(db):
+    merge_duplicate_vods(db)
+    run_script(db, 'migrations/0001_read_tables.sql')
+    rebuild_search(db)
+
+def merge_duplicate_names(db, table, column, references):
+    """Repoint `references` to the oldest of each set of same-named rows in `table`, and delete the rest."""
+    duplicates = db.cursor().execute(f"""
+    SELECT min(id), group_concat(id) FROM {table} GROUP BY {column} HAVING count(*) > 1;
+    """).fetchall()
+    for keep, ids in duplicates:
+        merged = [(keep, int(id)) for id in ids.split(',') if int(id) != keep]
+        for ref_table, ref_column in references:
+            db.cursor().executemany(f"UPDATE {ref_table} SET {ref_column} = ? WHERE {ref_column} = ?;", merged)
+        db.cursor().executemany(f"DELETE FROM {table} WHERE id = ?;", [(id,) for _, id in merged])
+
+def migrate_lookup_indexes(db):
+    merge_duplicate_names(db, 'player', 'tag', [('vod', 'p1_id'), ('vod', 'p2_id'), ('vod', 'p3_id'), ('vod', 'p4_id')])
+    merge_duplicate_names(db, 'event', 'name', [('vod', 'event_id')])
+    run_script(db, 'migrations/0002_lookup_indexes.sql')
+
+def migrate_search_lookups(db):
+    run_script(db, 'migrations/0003_search_lookups.sql')
+
+def migrate_channel_skipped_videos(db):
+    run_script(db, 'migrations/0004_channel_skipped_videos.sql')
+
+# Schema changes for databases made by an older schema.sql, in order. The
+# database's user_version is how many of them it already has.
+MIGRATIONS = [
+    migrate_read_tables,
+    migrate_lookup_indexes,
+    migrate_search_lookups,
+    migrate_channel_skipped_videos,
+]
+
+def get_schema_version(db):
+    return db.cursor().execute("PRAGMA user_version;").fetchone()[0]
+
+def migrate_db(db):
+    """Apply the migrations the database is missing, each in its own transaction."""
+    current = get_schema_version(db)
+    for version, migration in enumerate(MIGRATIONS[current:], current + 1):
+        db.cursor().execute("BEGIN IMMEDIATE;")
+        try:
+            migration(db)
+            db.cursor().execute(f"PRAGMA user_version = {version};")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        click.echo(f"Migrated the database to version {version} ({migration.__name__}).")
+
 def get_character_id(name):
     name = name.lower()
 
@@ -84,138 +508,808 @@ def ensure_player(player):
 
 def create_submission(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date):
     db = get_db()
-    db.cursor().execute("""
+    insert_submissions(db, [(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)])
+    db.commit()
+
+def insert_submissions(db, submissions):
+    """Insert (url, p1_char, p2_char, p1_tag, p2_tag, event, round, date) submissions without committing."""
+    db.cursor().executemany("""
     INSERT INTO submission (game_id, url, status, p1, c1, p2, c2, event, round, date)
     VALUES                 (?,       ?,   ?,      ?,  ?,  ?,  ?,  ?,     ?,     ?);
     """,
-    (RIVALS_OF_AETHER_TWO, url, NOT_REVIEWED_STATUS, p1_tag, p1_char, p2_tag, p2_char, event, round, date,))
-    db.commit()
+    [(RIVALS_OF_AETHER_TWO, url, NOT_REVIEWED_STATUS, p1_tag, p1_char, p2_tag, p2_char, event, round, date)
+     for url, p1_char, p2_char, p1_tag, p2_tag, event, round, date in submissions])
+
+class SubmissionQueue:
+    """Write-behind queue for form submissions.
+
+    put() appends the submission to this process's spool file and queues it,
+    and a background thread inserts queued submissions in batches, so the
+    request never waits on the database's write lock. When the queue is full
+    put() refuses instead of blocking. Spool files left by processes that died
+    before writing everything are replayed when the writer starts, on the first
+    put() or wait_for_replay(); a crash right after a batch commits can replay
+    that batch a second time, and a spool that can't be replayed, say because
+    the database isn't set up yet, is left for the next process. While the
+    database won't take writes at all, a batch is retried, staying in the
+    spool. Submissions the database rejects one at a time go to dead.jsonl in
+    the spool directory.
+    """
+
+    def __init__(self):
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start()
+
+    def start(self):
+        self.pid = os.getpid()
+        self.queue = queue.Queue()
+        self.spool_dir = settings['SUBMISSION_SPOOL_DIR']
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Claim spools from earlier processes first, including one that had our PID.
+        self.orphans = self.claim_orphaned_spools()
+        self.replayed = threading.Event()
+        self.spool = open(os.path.join(self.spool_dir, f'{self.pid}.jsonl'), 'a', encoding='utf-8')
+        self.seq = 0
+        self.pending = 0
+        threading.Thread(target=self.run, name='submission-writer', daemon=True).start()
+
+    def wait_for_replay(self):
+        """Start the writer if it isn't running and wait until orphaned spools are written."""
+        self.ensure_started()
+        self.replayed.wait()
+
+    def put(self, submission):
+        """Queue a (url, p1_char, p2_char, p1_tag, p2_tag, event, round, date) submission.
+
+        Returns False without queueing it if the queue is full.
+        """
+        self.ensure_started()
+        with self.lock:
+            # Counts the batch being written too, so a stuck writer fills it up.
+            if self.pending >= settings['SUBMISSION_QUEUE_SIZE']:
+                return False
+            self.seq += 1
+            self.spool.write(json.dumps({'seq': self.seq, 'submission': submission}) + '\n')
+            self.spool.flush()
+            self.pending += 1
+            self.queue.put_nowait((self.seq, submission))
+        return True
+
+    def run(self):
+        for path in self.orphans:
+            try:
+                self.replay(path)
+            except Exception:
+                # Left in place, for the next process to try again.
+                logging.getLogger(__name__).exception('Replaying %s failed', path)
+        self.replayed.set()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + settings['SUBMISSION_FLUSH_SECONDS']
+            while len(batch) < settings['SUBMISSION_BATCH_SIZE']:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            submissions = [submission for _, submission in batch]
+            delay = 1
+            while True:
+                try:
+                    self.write_or_dead_letter(submissions)
+                    break
+                except sqlite3.OperationalError:
+                    # The database won't take writes at all, say it's read-only
+                    # or missing the table. The batch stays pending, and so in
+                    # the spool, until it does.
+                    logging.getLogger(__name__).exception('Writing %d submissions failed, retrying in %ds', len(batch), delay)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 60)
+            with self.lock:
+                self.pending -= len(batch)
+                if self.pending == 0:
+                    self.spool.truncate(0)
+                else:
+                    self.spool.write(json.dumps({'written': batch[-1][0]}) + '\n')
+                self.spool.flush()
+
+    def write_or_dead_letter(self, submissions):
+        """Write a batch, and if a submission in it can't be written, each submission on its own.
+
+        The ones that fail on their own too are moved to dead.jsonl. Errors
+        from the database itself, like a missing table, aren't the
+        submissions' fault and are raised instead.
+        """
+        try:
+            self.write(submissions)
+            return
+        except sqlite3.OperationalError:
+            raise
+        except Exception:
+            logging.getLogger(__name__).exception('Writing %d submissions failed, trying them one at a time', len(submissions))
+        for submission in submissions:
+            try:
+                self.write([submission])
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                logging.getLogger(__name__).exception('Writing submission %r failed, moving it to dead.jsonl', submission)
+                self.dead_letter([submission], e)
+
+    def dead_letter(self, submissions, error):
+        try:
+            with open(os.path.join(self.spool_dir, 'dead.jsonl'), 'a', encoding='utf-8') as f:
+                for submission in submissions:
+                    f.write(json.dumps({'submission': submission, 'error': repr(error)}) + '\n')
+        except OSError:
+            logging.getLogger(__name__).exception('Could not write to dead.jsonl, dropping %r', submissions)
+
+    def write(self, submissions):
+        delay = 0.1
+        while True:
+            db = get_db()
+            try:
+                insert_submissions(db, submissions)
+                db.commit()
+                return
+            except sqlite3.OperationalError as e:
+                # Most likely the database is locked. Keep the batch and retry.
+                db.rollback()
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                logging.getLogger(__name__).warning('Writing %d submissions failed, retrying: %s', len(submissions), e)
+                time.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    def claim_orphaned_spools(self):
+        claimed = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            pid = name.split('.')[0]
+            if not pid.isdigit() or (int(pid) != self.pid and pid_alive(int(pid))):
+                continue
+            path = os.path.join(self.spool_dir, f'{self.pid}.replay.{name}')
+            try:
+                os.rename(os.path.join(self.spool_dir, name), path)
+            except FileNotFoundError:
+                # Another process claimed it first.
+                continue
+            claimed.append(path)
+        return claimed
+
+    def replay(self, path):
+        submissions = {}
+        written = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut off by the crash.
+                    continue
+                if 'written' in entry:
+                    written = max(written, entry['written'])
+                else:
+                    submissions[entry['seq']] = entry['submission']
+        self.write_or_dead_letter([submission for seq, submission in sorted(submissions.items()) if seq > written])
+        os.remove(path)
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+submission_queue = SubmissionQueue()
 
 def vod_exists(url):
-    db = get_db()
-    existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
+    """Return whether a VOD of the same video is already in the archive, whatever form its URL takes."""
+    db = get_db(readonly=True)
+    existing_vod = db.cursor().execute("SELECT id FROM vod WHERE platform = ? AND video_id = ? LIMIT 1;", canonical_video_key(url)).fetchone()
     return True if existing_vod else False
 
-def latest_vods(amount=100):
-    db = get_db()
-    vods = db.cursor().execute("""
-    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
-    FROM vod
-        INNER JOIN event e ON e.id = vod.event_id
-        INNER JOIN player p1 ON p1.id = vod.p1_id
-        INNER JOIN player p2 ON p2.id = vod.p2_id
-        INNER JOIN game_character c1 ON c1.id = vod.c1_id
-        INNER JOIN game_character c2 ON c2.id = vod.c2_id
-    ORDER BY vod_date DESC
-    LIMIT ?
-    """, (amount,)).fetchall()
-    
-    result = []
-    for id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_date in vods:
-        result.append(Vod(
-            url=url,
-            round=round,
-            p1_tag=p1_tag,
-            p2_tag=p2_tag,
-            c1_icon_url=c1_icon_url,
-            c2_icon_url=c2_icon_url,
-            vod_date=vod_date,
-            event_name=event
-        ))
-    return result
+def existing_video_keys(db, keys):
+    """Return the (platform, video_id) keys in `keys` that already have a VOD."""
+    keys = list(dict.fromkeys(keys))
+    existing = set()
+    for i in range(0, len(keys), 250):
+        chunk = keys[i:i + 250]
+        # A row-value IN over more than one key scans the whole index, so
+        # look each key up from the list instead.
+        existing.update(tuple(row) for row in db.cursor().execute(f"""
+        SELECT vod.platform, vod.video_id
+        FROM (VALUES {', '.join(['(?, ?)'] * len(chunk))}) AS wanted CROSS JOIN vod
+        WHERE vod.platform = wanted.column1 AND vod.video_id = wanted.column2;
+        """, [part for key in chunk for part in key]))
+    return existing
 
-def search_vods(p1, p2, c1, c2, event, amount=200):
-    db = get_db()
+def insert_vod(db, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, submission_id=None):
+    """Insert a VOD unless its video is already in the archive. Returns whether it was inserted."""
+    platform, video_id = canonical_video_key(url)
+    inserted = db.cursor().execute("""
+    INSERT OR IGNORE INTO vod (game_id, event_id, url, platform, video_id, p1_id, p2_id, c1_id, c2_id, round, vod_date, submission_id)
+    VALUES                    (?,       ?,        ?,   ?,        ?,        ?,     ?,     ?,     ?,     ?,     ?,        ?);
+    """, (RIVALS_OF_AETHER_TWO, event_id, url, platform, video_id, p1_id, p2_id, c1_id, c2_id, round, vod_date, submission_id))
+    return inserted.rowcount > 0
+
+def get_write_state():
+    """Return (generation, updated_at) for the last change to vod_listing."""
+    db = get_db(readonly=True)
+    return tuple(db.cursor().execute("SELECT generation, updated_at FROM write_generation WHERE id = 1;").fetchone())
+
+def get_write_generation():
+    return get_write_state()[0]
+
+def encode_cursor(direction, vod_date, id):
+    return base64.urlsafe_b64encode(json.dumps([direction, vod_date, id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (direction, vod_date, id) for a cursor token, or None if it isn't valid."""
+    if not cursor:
+        return None
+    try:
+        direction, vod_date, id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if direction not in ('after', 'before') or not isinstance(vod_date, str) or not isinstance(id, int):
+        return None
+    return direction, vod_date, id
+
+def latest_vods(amount=50, cursor=None):
+    key = ('latest', amount, cursor)
+    generation = get_write_generation()
+    result = result_cache.get(key, generation)
+    if result is None:
+        result = query_vod_page('', [], '', amount, cursor)
+        result_cache.put(key, generation, result)
+    return result
 
-    p1_match = '%' + p1 + '%'
-    p2_match = '%' + p2 + '%'
-    c1_match = '%' + c1 + '%'
-    c2_match = '%' + c2 + '%'
-    event_match = '%' + event + '%'
+def search_filter(p1, p2, c1, c2, event):
+    """Build the vod_search conditions for a search.
 
-    vods = None
+    Returns a (sql, params) pair to use as `WHERE <sql>` against vod_search,
+    or None if the search doesn't filter anything.
+    """
+    # Each term has to match at least one of its columns.
+    terms = [
+        (p1, ['p1_tag', 'p2_tag']),
+        (p2, ['p1_tag', 'p2_tag']),
+        (event, ['event_name']),
+    ]
     if c1 != c2:
-        vods = db.cursor().execute("""
-        SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
-        FROM vod
-            INNER JOIN event e ON e.id = vod.event_id
-            INNER JOIN player p1 ON p1.id = vod.p1_id
-            INNER JOIN player p2 ON p2.id = vod.p2_id
-            INNER JOIN game_character c1 ON c1.id = vod.c1_id
-            INNER JOIN game_character c2 ON c2.id = vod.c2_id
-        WHERE
-            (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (c1.name LIKE ? OR c2.name LIKE ?)
-            AND (c1.name LIKE ? OR c2.name LIKE ?)
-            AND (e.name LIKE ?)
-        ORDER BY vod_date DESC
-        LIMIT ?;
-        """, (p1_match, p1_match, p2_match, p2_match, c1_match, c1_match, c2_match, c2_match, event_match, amount,)).fetchall()
+        terms.append((c1, ['c1_name', 'c2_name']))
+        terms.append((c2, ['c1_name', 'c2_name']))
     else:
-        vods = db.cursor().execute("""
-        SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
-        FROM vod
-            INNER JOIN event e ON e.id = vod.event_id
-            INNER JOIN player p1 ON p1.id = vod.p1_id
-            INNER JOIN player p2 ON p2.id = vod.p2_id
-            INNER JOIN game_character c1 ON c1.id = vod.c1_id
-            INNER JOIN game_character c2 ON c2.id = vod.c2_id
-        WHERE
-            (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (c1.name LIKE ? AND c2.name LIKE ?)
-            AND (e.name LIKE ?)
-        ORDER BY vod_date DESC
-        LIMIT ?;
-        """, (p1_match, p1_match, p2_match, p2_match, c1_match, c1_match, event_match, amount,)).fetchall()
-
-    result = []
-    for id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_date in vods:
-        # Make the character order match the search query if it doesn't already.
-        if c2_name.lower() == c1:
-            result.append(Vod(
-                url=url,
-                round=round,
-                p1_tag=p2_tag,
-                p2_tag=p1_tag,
-                c1_icon_url=c2_icon_url,
-                c2_icon_url=c1_icon_url,
-                vod_date=vod_date,
-                event_name=event
-            ))
+        # Dittos need the character on both sides.
+        terms.append((c1, ['c1_name']))
+        terms.append((c1, ['c2_name']))
+
+    phrases = []
+    likes = []
+    params = []
+    for term, columns in terms:
+        if not term:
+            continue
+        # The trigram index can't look up terms shorter than three characters,
+        # and LIKE wildcards in the term have to keep working.
+        if len(term) < 3 or '%' in term or '_' in term:
+            likes.append('(' + ' OR '.join(f'{column} LIKE ?' for column in columns) + ')')
+            params += ['%' + term + '%'] * len(columns)
+        else:
+            phrases.append('{' + ' '.join(columns) + '} : "' + term.replace('"', '""') + '"')
+
+    conditions = []
+    if phrases:
+        conditions.append('vod_search MATCH ?')
+        params.insert(0, ' AND '.join(phrases))
+    conditions += likes
+    if not conditions:
+        return None
+    return ' AND '.join(conditions), params
+
+def matching_characters(term):
+    db = get_db(readonly=True)
+    return [id for id, in db.cursor().execute("SELECT id FROM game_character WHERE name LIKE ?;", ('%' + term + '%',))]
+
+def character_condition(c1, c2):
+    """Return the (sql, params, lookups) condition on vod_listing's character ids for a character-only search.
+
+    The characters are matched by name the way vod_search would. A matchup of
+    two named characters is read off the matchup index in both orders.
+    Otherwise filtering the ids lets the date index serve the page a row at a
+    time, where vod_search would have to find and sort every VOD with a
+    popular character first.
+    """
+    if c1 and c2:
+        ids1 = matching_characters(c1)
+        ids2 = matching_characters(c2)
+        # Two terms for the same character match any VOD with it, not just dittos.
+        if len(ids1) == 1 and len(ids2) == 1 and (ids1 != ids2 or c1 == c2):
+            lookups = [('c1_id = ? AND c2_id = ?', ids1 + ids2)]
+            if ids1 != ids2:
+                lookups.append(('c1_id = ? AND c2_id = ?', ids2 + ids1))
+            return "(+c1_id = ? AND +c2_id = ? OR +c1_id = ? AND +c2_id = ?)", ids1 + ids2 + ids2 + ids1, lookups
+    return (*character_filter(c1, c2), [])
+
+def character_filter(c1, c2):
+    """Return the (sql, params) condition matching the characters by name, for another index to serve the page."""
+    # The + keeps the planner off the c1_id and c2_id indexes, which would need a sort.
+    side = "IN (SELECT id FROM game_character WHERE name LIKE ?)"
+    if c1 == c2:
+        return f"+c1_id {side} AND +c2_id {side}", ['%' + c1 + '%'] * 2
+    conditions = []
+    params = []
+    for term in (c1, c2):
+        if term:
+            conditions.append(f"(+c1_id {side} OR +c2_id {side})")
+            params += ['%' + term + '%'] * 2
+    return ' AND '.join(conditions), params
+
+# A term matching more players or events than this is searched for in
+# vod_search instead of reading each one's VODs. Each player is read twice,
+# and SQLite takes at most 500 reads in one UNION ALL.
+NAME_LOOKUP_LIMIT = 100
+
+def matching_names(table, term):
+    """Return the ids of the players or events whose name contains `term`, matched the way vod_search would.
+
+    Returns None if it matches more than NAME_LOOKUP_LIMIT names.
+    """
+    db = get_db(readonly=True)
+    ids = [id for id, in db.cursor().execute(
+        f"SELECT rowid FROM {table}_search WHERE {table}_search MATCH ? LIMIT ?;",
+        ('"' + term.replace('"', '""') + '"', NAME_LOOKUP_LIMIT + 1)
+    )]
+    return ids if len(ids) <= NAME_LOOKUP_LIMIT else None
+
+def lookup_condition(p1, p2, c1, c2, event):
+    """Return the (sql, params, lookups) condition for a search with player or event terms that doesn't need vod_search, or None.
+
+    `lookups` are the (sql, params) conditions reading the VODs of each name
+    the term matching the fewest names matches. Terms too short for the trigram index are matched with LIKE row by
+    row, as vod_search would.
+    """
+    conditions = []
+    params = []
+    lookups = None
+    for term, table, id_columns, name_columns in (
+        (p1, 'player', ['p1_id', 'p2_id'], ['p1_tag', 'p2_tag']),
+        (p2, 'player', ['p1_id', 'p2_id'], ['p1_tag', 'p2_tag']),
+        (event, 'event', ['event_id'], ['event_name']),
+    ):
+        if not term:
+            continue
+        # The + keeps the planner on the index of the lookup being read, or
+        # the date index.
+        if len(term) < 3 or '%' in term or '_' in term:
+            conditions.append('(' + ' OR '.join(f'+{column} LIKE ?' for column in name_columns) + ')')
+            params += ['%' + term + '%'] * len(name_columns)
+            continue
+        ids = matching_names(table, term)
+        if ids is None:
+            return None
+        if not ids:
+            return 'false', [], []
+        placeholders = ', '.join('?' * len(ids))
+        conditions.append('(' + ' OR '.join(f'+{column} IN ({placeholders})' for column in id_columns) + ')')
+        params += ids * len(id_columns)
+        term_lookups = [(f'{column} = ?', [id]) for id in ids for column in id_columns]
+        if lookups is None or len(term_lookups) < len(lookups):
+            lookups = term_lookups
+    if c1 or c2:
+        where, character_params = character_filter(c1, c2)
+        conditions.append(where)
+        params += character_params
+    return ' AND '.join(conditions), params, lookups or []
+
+def search_condition(p1, p2, c1, c2, event):
+    """Return the (sql, params, lookups) condition on vod_listing for a search, '' if none.
+
+    Player and event terms are looked up in player_search and event_search,
+    and `lookups` has the conditions whose VODs to read off vod_listing's
+    indexes, so a page costs about the same however many VODs
+    match. Searches whose only terms are too short for that, like character
+    searches, filter the date index's rows instead. A term matching more than
+    NAME_LOOKUP_LIMIT names finds every vod_search match, and sorts them by
+    date before taking a page.
+    """
+    if not (p1 or p2 or event):
+        if c1 or c2:
+            return character_condition(c1, c2)
+        return '', [], []
+    lookup = lookup_condition(p1, p2, c1, c2, event)
+    if lookup:
+        return lookup
+    return (*fts_condition(p1, p2, c1, c2, event), [])
+
+def fts_condition(p1, p2, c1, c2, event):
+    where, params = search_filter(p1, p2, c1, c2, event)
+    return f"id IN (SELECT rowid FROM vod_search WHERE {where})", params
+
+def search_vods(p1, p2, c1, c2, event, amount=50, cursor=None):
+    # Tags and events match case-insensitively. Characters don't, since c1
+    # decides which side each VOD is shown from.
+    p1 = (p1 or '').lower()
+    p2 = (p2 or '').lower()
+    event = (event or '').lower()
+    c1 = c1 or ''
+    c2 = c2 or ''
+
+    key = ('search', p1, p2, c1, c2, event, amount, cursor)
+    generation = get_write_generation()
+    result = result_cache.get(key, generation)
+    if result is None:
+        where, params, lookups = search_condition(p1, p2, c1, c2, event)
+        result = query_vod_page(where, params, c1, amount, cursor, lookups)
+        result_cache.put(key, generation, result)
+    return result
+
+def keyset_filter(where, params, position):
+    """Add the condition for reading past a decoded cursor position.
+
+    Returns the (where clause, params, sort order) to read with.
+    """
+    conditions = [where] if where else []
+    order = 'DESC'
+    if position:
+        direction, vod_date, id = position
+        if direction == 'after':
+            conditions.append('(vod_date, id) < (?, ?)')
         else:
-            result.append(Vod(
-                url=url,
-                round=round,
-                p1_tag=p1_tag,
-                p2_tag=p2_tag,
-                c1_icon_url=c1_icon_url,
-                c2_icon_url=c2_icon_url,
-                vod_date=vod_date,
-                event_name=event
-            ))
+            conditions.append('(vod_date, id) > (?, ?)')
+            order = 'ASC'
+        params = [*params, vod_date, id]
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    return where, params, order
+
+def lookup_filter(where, params, lookups, order, limit):
+    """Make a keyset-filtered condition read the VODs of each lookup in search_condition off its own index.
+
+    Only the first `limit` matches of each are read and sorted together,
+    however many VODs match.
+    """
+    limit_clause = f'ORDER BY vod_date {order}, id {order} LIMIT ?' if limit is not None else ''
+    reads = []
+    lookup_params = []
+    for condition, condition_params in lookups:
+        reads.append(f'SELECT id FROM (SELECT id FROM vod_listing {where} AND {condition} {limit_clause})')
+        lookup_params += [*params, *condition_params] + ([limit] if limit is not None else [])
+    return f"WHERE id IN ({' UNION ALL '.join(reads)})", lookup_params
+
+def execute_vod_page(where, params, amount, position, lookups=()):
+    """Start reading one page of vod_listing, plus one row to tell whether there's another page.
+
+    Returns the cursor and the sort order it reads in.
+    """
+    where, params, order = keyset_filter(where, params, position)
+    if lookups:
+        where, params = lookup_filter(where, params, lookups, order, amount + 1)
+    db = get_db(readonly=True)
+    vods = db.cursor().execute(f"""
+    SELECT id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event_name, round, vod_date, CAST(vod_date AS TEXT)
+    FROM vod_listing
+    {where}
+    ORDER BY vod_date {order}, id {order}
+    LIMIT ?;
+    """, (*params, amount + 1,))
+    return vods, order
+
+def vod_from_row(row, c1):
+    id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_date, _ = row
+    # Make the character order match the search query if it doesn't already.
+    if c2_name.lower() == c1:
+        p1_tag, c1_icon_url, p2_tag, c2_icon_url = p2_tag, c2_icon_url, p1_tag, c1_icon_url
+    return Vod(
+        url=url,
+        round=round,
+        p1_tag=p1_tag,
+        p2_tag=p2_tag,
+        c1_icon_url=c1_icon_url,
+        c2_icon_url=c2_icon_url,
+        vod_date=vod_date,
+        event_name=event
+    )
+
+def query_vod_page(where, params, c1, amount, cursor, lookups=()):
+    """Read one page of vod_listing, newest first.
+
+    Pages are keyed on (vod_date, id) rather than an offset, so every page
+    costs the same to read. VODs with c1 as their second character are
+    flipped so the character order matches the search.
+    """
+    position = decode_cursor(cursor)
+    vods, order = execute_vod_page(where, params, amount, position, lookups)
+    vods = vods.fetchall()
+
+    backwards = order == 'ASC'
+    more = len(vods) > amount
+    vods = vods[:amount]
+    if backwards:
+        vods.reverse()
+
+    next_cursor = None
+    prev_cursor = None
+    if vods:
+        if more or backwards:
+            next_cursor = encode_cursor('after', vods[-1][11], vods[-1][0])
+        if (more and backwards) or (position and not backwards):
+            prev_cursor = encode_cursor('before', vods[0][11], vods[0][0])
+
+    return VodPage(vods=tuple(vod_from_row(vod, c1) for vod in vods), next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+class VodStream:
+    """One page of VODs, read from the cursor while it's iterated.
+
+    For streaming pages, so the page's rows are never all in memory and the
+    query only runs once the page gets to them. Like VodPage it has
+    next_cursor and prev_cursor, but they're only set after iterating.
+    Pages read backwards get reversed, so those are read in full.
+    """
+
+    def __init__(self, where, params, c1, amount, cursor, lookups=()):
+        self.where = where
+        self.params = params
+        self.lookups = lookups
+        self.c1 = c1
+        self.amount = amount
+        self.cursor = cursor
+        self.next_cursor = None
+        self.prev_cursor = None
+        self.vods = None
+        self.first = None
+
+    def start(self):
+        if self.vods is not None:
+            return
+        position = decode_cursor(self.cursor)
+        if position and position[0] == 'before':
+            page = query_vod_page(self.where, self.params, self.c1, self.amount, self.cursor, self.lookups)
+            self.next_cursor = page.next_cursor
+            self.prev_cursor = page.prev_cursor
+            self.vods = iter(page.vods)
+        else:
+            self.vods = self.read(position)
+        self.first = next(self.vods, None)
+
+    def read(self, position):
+        vods, _ = execute_vod_page(self.where, self.params, self.amount, position, self.lookups)
+        try:
+            last = None
+            for n, row in enumerate(vods):
+                if n == self.amount:
+                    self.next_cursor = encode_cursor('after', last[11], last[0])
+                    break
+                if n == 0 and position:
+                    self.prev_cursor = encode_cursor('before', row[11], row[0])
+                last = row
+                yield vod_from_row(row, self.c1)
+        finally:
+            # Don't leave the pooled connection holding a read snapshot if
+            # the page stops early.
+            vods.close()
+
+    def __bool__(self):
+        self.start()
+        return self.first is not None
+
+    def __iter__(self):
+        self.start()
+        if self.first is not None:
+            yield self.first
+            yield from self.vods
+
+def stream_vods(p1='', p2='', c1='', c2='', event='', amount=50, cursor=None):
+    """Return a VodStream over a page of the VODs matching a search, newest first."""
+    p1 = (p1 or '').lower()
+    p2 = (p2 or '').lower()
+    event = (event or '').lower()
+    c1 = c1 or ''
+    c2 = c2 or ''
+
+    where, params, lookups = search_condition(p1, p2, c1, c2, event)
+    return VodStream(where, params, c1, amount, cursor, lookups)
+
+def iter_vods(p1='', p2='', c1='', c2='', event='', cursor=None, limit=None, chunk_size=500):
+    """Yield the VODs matching a search as dicts, newest first.
+
+    Rows are read from the cursor in chunks and never collected, so this is
+    safe for dumping the whole archive. Each dict carries the cursor to pass
+    back to continue after it.
+    """
+    p1 = (p1 or '').lower()
+    p2 = (p2 or '').lower()
+    event = (event or '').lower()
+    c1 = c1 or ''
+    c2 = c2 or ''
+
+    where, params, lookups = search_condition(p1, p2, c1, c2, event)
+    where, params, order = keyset_filter(where, params, decode_cursor(cursor))
+    if lookups:
+        where, params = lookup_filter(where, params, lookups, order, limit)
+    limit_clause = 'LIMIT ?' if limit is not None else ''
+    if limit is not None:
+        params = [*params, limit]
+
+    db = get_db(readonly=True)
+    vods = db.cursor().execute(f"""
+    SELECT id, url, p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url, event_name, round, CAST(vod_date AS TEXT)
+    FROM vod_listing
+    {where}
+    ORDER BY vod_date {order}, id {order}
+    {limit_clause};
+    """, params)
+    try:
+        while True:
+            rows = vods.fetchmany(chunk_size)
+            if not rows:
+                break
+            for id, url, p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url, event_name, round, vod_date in rows:
+                # Make the character order match the search query if it doesn't already.
+                if c2_name.lower() == c1:
+                    p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url = p2_tag, c2_name, c2_icon_url, p1_tag, c1_name, c1_icon_url
+                yield {
+                    'url': url,
+                    'event_name': event_name,
+                    'round': round or '',
+                    'vod_date': vod_date or None,
+                    'p1_tag': p1_tag,
+                    'c1_name': c1_name,
+                    'c1_icon_url': c1_icon_url,
+                    'p2_tag': p2_tag,
+                    'c2_name': c2_name,
+                    'c2_icon_url': c2_icon_url,
+                    'cursor': encode_cursor('after', vod_date, id),
+                }
+    finally:
+        # Don't leave the pooled connection holding a read snapshot if the
+        # caller stops early.
+        vods.close()
+
+def character_names():
+    db = get_db(readonly=True)
+    return [name for name, in db.cursor().execute("SELECT lower(name) FROM game_character ORDER BY name;")]
+
+def character_icons():
+    db = get_db(readonly=True)
+    return db.cursor().execute("SELECT name, icon_url FROM game_character WHERE icon_url IS NOT NULL ORDER BY name;").fetchall()
+
+def vods_listed_since(last_id):
+    """Return the newest listed VOD id, how many VODs are listed, and
+    {(c1, c2): count} of the character pairs listed after `last_id`."""
+    db = get_db(readonly=True)
+    newest_id = db.cursor().execute("SELECT coalesce(max(id), 0) FROM vod_listing;").fetchone()[0]
+    # matchup_stats counts every listed VOD once.
+    count = db.cursor().execute("SELECT coalesce(sum(vods), 0) FROM matchup_stats;").fetchone()[0]
+    matchups = db.cursor().execute("""
+    SELECT lower(c1_name), lower(c2_name), count(*)
+    FROM vod_listing
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2;
+    """, (last_id, newest_id)).fetchall()
+    return newest_id, count, {(c1, c2): n for c1, c2, n in matchups}
+
+def get_stats(players=50, head_to_heads=50, characters_per_player=3):
+    """Return the character matchup matrix and the most-VOD'd players and pairs.
+
+    Everything comes from the summary tables, so the cost doesn't grow with
+    the archive.
+    """
+    key = ('stats', players, head_to_heads, characters_per_player)
+    generation = get_write_generation()
+    result = result_cache.get(key, generation)
+    if result is not None:
+        return result
+
+    db = get_db(readonly=True)
+    characters = db.cursor().execute("SELECT id, name FROM game_character ORDER BY name;").fetchall()
+    counts = {}
+    for c1_id, c2_id, vods in db.cursor().execute("SELECT c1_id, c2_id, vods FROM matchup_stats;"):
+        counts[c1_id, c2_id] = counts[c2_id, c1_id] = vods
+    matchups = tuple(tuple(counts.get((c1_id, c2_id), 0) for c2_id, _ in characters) for c1_id, _ in characters)
+    total = db.cursor().execute("SELECT coalesce(sum(vods), 0) FROM matchup_stats;").fetchone()[0]
+
+    top_players = db.cursor().execute("""
+    SELECT player_stats.player_id, player.tag, player_stats.vods
+    FROM player_stats INNER JOIN player ON player.id = player_stats.player_id
+    ORDER BY player_stats.vods DESC, player.tag
+    LIMIT ?;
+    """, (players,)).fetchall()
+    player_characters = {}
+    for player_id, name, vods in db.cursor().execute(f"""
+    SELECT player_character_stats.player_id, game_character.name, player_character_stats.vods
+    FROM player_character_stats INNER JOIN game_character ON game_character.id = player_character_stats.character_id
+    WHERE player_character_stats.player_id IN ({', '.join('?' * len(top_players))})
+    ORDER BY player_character_stats.vods DESC, game_character.name;
+    """, [player_id for player_id, _, _ in top_players]):
+        mains = player_characters.setdefault(player_id, [])
+        if len(mains) < characters_per_player:
+            mains.append((name, vods))
+
+    top_head_to_heads = db.cursor().execute("""
+    SELECT p1.tag, p2.tag, head_to_head_stats.vods
+    FROM head_to_head_stats
+        INNER JOIN player p1 ON p1.id = head_to_head_stats.p1_id
+        INNER JOIN player p2 ON p2.id = head_to_head_stats.p2_id
+    WHERE head_to_head_stats.p1_id != head_to_head_stats.p2_id
+    ORDER BY head_to_head_stats.vods DESC, p1.tag, p2.tag
+    LIMIT ?;
+    """, (head_to_heads,)).fetchall()
+
+    result = Stats(
+        total_vods=total,
+        characters=tuple(name for _, name in characters),
+        matchups=matchups,
+        players=tuple(PlayerStats(tag=tag, vods=vods, characters=tuple(player_characters.get(player_id, ()))) for player_id, tag, vods in top_players),
+        head_to_heads=tuple(HeadToHead(p1_tag=p1_tag, p2_tag=p2_tag, vods=vods) for p1_tag, p2_tag, vods in top_head_to_heads),
+    )
+    result_cache.put(key, generation, result)
     return result
 
+# Queries for the names each suggestion field can complete to. Only players
+# and events with VODs on the site are suggested.
+SUGGEST_QUERIES = {
+    'player': "SELECT player.tag FROM player_stats INNER JOIN player ON player.id = player_stats.player_id;",
+    'event': "SELECT name FROM event WHERE EXISTS (SELECT 1 FROM vod_listing WHERE event_id = event.id);",
+}
+
+suggest_indexes = {}
+suggest_lock = threading.Lock()
+
+def get_suggest_index(field):
+    """Return the PrefixIndex for a field, rebuilding it if the write generation has moved on."""
+    generation = get_write_generation()
+    entry = suggest_indexes.get(field)
+    if entry is None or entry[0] < generation:
+        with suggest_lock:
+            entry = suggest_indexes.get(field)
+            if entry is None or entry[0] < generation:
+                db = get_db(readonly=True)
+                names = [name for name, in db.cursor().execute(SUGGEST_QUERIES[field])]
+                entry = suggest_indexes[field] = (generation, PrefixIndex(names))
+    return entry[1]
+
+def suggest(field, prefix, limit=10):
+    """Return up to `limit` player tags or event names with a word starting with `prefix`."""
+    return get_suggest_index(field).search(prefix, limit)
+
+def vod_date_text(vod_date):
+    """Format a datetime the way vod_date is stored, e.g. '2025-03-18 02:38:53+00:00'.
+
+    Pages sort on the text, so every writer has to use the same format. Naive
+    datetimes are taken to be UTC. None gives ''.
+    """
+    if vod_date is None:
+        return ''
+    if vod_date.tzinfo is None:
+        vod_date = vod_date.replace(tzinfo=timezone.utc)
+    return vod_date.astimezone(timezone.utc).isoformat(sep=' ', timespec='seconds')
+
 def parse_date(str):
+    if not str:
+        return None
     vod_parts = list(str.split('/'))
-    if vod_parts == 3:
+    if len(vod_parts) == 3:
         try:
             month = int(vod_parts[0])
             day = int(vod_parts[1])
             year = int('20' + vod_parts[2])
+            return datetime(year, month, day)
         except Exception as e:
             print(e)
-
-        return datetime(year, month, day)
-    elif vod_parts == 2:
+    elif len(vod_parts) == 2:
         try:
             month = int(vod_parts[0])
             day = int(vod_parts[1])
             year = datetime.now().year
+            return datetime(year, month, day)
         except Exception as e:
             print(e)
-        return datetime(year, month, day)
 
     return None
 
@@ -232,48 +1326,396 @@ def init_db_command():
     init_db()
     click.echo('Initialized the database.')
 
+def rebuild_search(db):
+    """Refill vod_listing, the search indexes and the stats from the vod table without committing."""
+    db.cursor().execute("UPDATE bulk_load SET active = 1 WHERE id = 1;")
+    db.cursor().execute("DELETE FROM vod_listing;")
+    db.cursor().execute(LISTING_INSERT + ";")
+    db.cursor().execute("INSERT INTO vod_search (vod_search) VALUES ('rebuild');")
+    db.cursor().execute("INSERT INTO vod_search (vod_search) VALUES ('optimize');")
+    db.cursor().execute("INSERT INTO player_search (player_search) VALUES ('rebuild');")
+    db.cursor().execute("INSERT INTO event_search (event_search) VALUES ('rebuild');")
+    rebuild_stats(db)
+    db.cursor().execute("UPDATE write_generation SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;")
+    db.cursor().execute("UPDATE bulk_load SET active = 0 WHERE id = 1;")
+
+@click.command('migrate-db')
+def migrate_db_command():
+    """Bring an existing database up to the current schema, keeping its data."""
+    db = get_db()
+    if get_schema_version(db) >= len(MIGRATIONS):
+        click.echo(f"The database is already at version {get_schema_version(db)}.")
+        return
+    migrate_db(db)
+
+@click.command('check-plans')
+def check_plans_command():
+    """Check the query plans of the queries the site runs for unexpected scans and sorts.
+
+    Runs everything in PLAN_CHECKS against the database, then rolls back, and
+    fails if any statement it ran does a full scan or temporary sort that
+    its check doesn't allow.
+    """
+    db = get_db()
+    if get_schema_version(db) < len(MIGRATIONS):
+        raise click.ClickException("The database is on an old schema; run flask migrate-db first.")
+
+    # Cached results would skip the queries.
+    maxsize = result_cache.maxsize
+    result_cache.maxsize = 0
+    result_cache.clear()
+    suggest_indexes.clear()
+    num_failed = 0
+    try:
+        for name, check, allowed in PLAN_CHECKS:
+            start_query_stats(record=True)
+            try:
+                check(db)
+            finally:
+                statements = stop_query_stats().statements
+            failed = False
+            for sql in dict.fromkeys(sql for sql, _ in statements):
+                params = next(params for statement, params in statements if statement == sql)
+                problems = plan_problems(db, sql, params, allowed)
+                if problems:
+                    failed = True
+                    click.echo(f"{name}: {' '.join(sql.split())}", err=True)
+                    for problem in problems:
+                        click.echo(f"    {problem}", err=True)
+            num_failed += failed
+            if not failed:
+                click.echo(f"{name}: ok")
+    finally:
+        db.rollback()
+        result_cache.maxsize = maxsize
+        result_cache.clear()
+        suggest_indexes.clear()
+    if num_failed:
+        raise click.ClickException(f"{num_failed} of {len(PLAN_CHECKS)} checks have unexpected scans or sorts.")
+    click.echo(f"All {len(PLAN_CHECKS)} checks passed.")
+
+@click.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild vod_listing, the search index and the stats from the vod table."""
+    db = get_db()
+    rebuild_search(db)
+    db.commit()
+    num_vods = db.cursor().execute("SELECT count(*) FROM vod_listing;").fetchone()[0]
+    click.echo(f"Indexed {num_vods} vods.")
+
+@click.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the stats tables from vod_listing."""
+    db = get_db()
+    rebuild_stats(db)
+    db.commit()
+    num_players = db.cursor().execute("SELECT count(*) FROM player_stats;").fetchone()[0]
+    click.echo(f"Rebuilt stats for {num_players} players.")
+
+# Pages read the date index newest first and stop at their LIMIT. With a
+# filter that's as far back as the page's last match.
+DATE_ORDER = 'SCAN vod_listing USING INDEX idx_vod_listing_date'
+# FTS matches come back in rowid order, so a term matching more names than
+# NAME_LOOKUP_LIMIT sorts every VOD it matches by date. It's the one sort
+# that grows with the archive.
+SEARCH_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Searches on players, events and matchups sort the first page's worth of
+# VODs read for each of at most NAME_LOOKUP_LIMIT names.
+LOOKUP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# There are a few dozen characters. Searches look theirs up by name, and the
+# list is read whole and sorted by name.
+CHARACTER_LOOKUP = 'SCAN game_character'
+CHARACTER_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+CHECK_CURSOR_DATE = '2025-01-01 00:00:00+00:00'
+# The busiest players and events, for searches that look them up.
+CHECK_PLAYERS = "SELECT tag FROM player_stats INNER JOIN player ON player.id = player_stats.player_id ORDER BY vods DESC LIMIT 2;"
+CHECK_EVENTS = "SELECT event_name FROM vod_listing ORDER BY vod_date DESC LIMIT 1;"
+
+def check_names(db, query):
+    """Names from the database for check-plans to search for, then placeholders in case it's empty."""
+    return [name for name, in sqlite3.Cursor(db).execute(query)] + ['abcd', 'efgh']
+
+# What check-plans runs, and the exact full scans and temporary sorts each
+# check's statements may have. Any other scan or sort fails the check.
+PLAN_CHECKS = [
+    ('latest page', lambda db: latest_vods(), (DATE_ORDER,)),
+    ('older page', lambda db: latest_vods(cursor=encode_cursor('after', CHECK_CURSOR_DATE, 1)), ()),
+    ('newer page', lambda db: latest_vods(cursor=encode_cursor('before', CHECK_CURSOR_DATE, 1)), ()),
+    ('streamed page', lambda db: list(stream_vods(cursor=encode_cursor('after', CHECK_CURSOR_DATE, 1))), (DATE_ORDER,)),
+    ('character search', lambda db: search_vods('', '', 'clairen', '', ''), (CHARACTER_LOOKUP, DATE_ORDER)),
+    ('matchup search', lambda db: search_vods('', '', 'clairen', 'fleet', ''), (CHARACTER_LOOKUP, LOOKUP_SORT)),
+    ('ditto search', lambda db: search_vods('', '', 'kragg', 'kragg', ''), (CHARACTER_LOOKUP, LOOKUP_SORT)),
+    ('player search', lambda db: search_vods(check_names(db, CHECK_PLAYERS)[0], '', '', '', ''), (LOOKUP_SORT,)),
+    ('head-to-head search', lambda db: search_vods(*check_names(db, CHECK_PLAYERS)[:2], '', '', ''), (LOOKUP_SORT,)),
+    ('player and character search', lambda db: search_vods(check_names(db, CHECK_PLAYERS)[0], '', 'kragg', '', ''), (CHARACTER_LOOKUP, LOOKUP_SORT)),
+    ('event search', lambda db: search_vods('', '', '', '', check_names(db, CHECK_EVENTS)[0]), (LOOKUP_SORT,)),
+    ('player search page', lambda db: list(stream_vods(check_names(db, CHECK_PLAYERS)[0], cursor=encode_cursor('after', CHECK_CURSOR_DATE, 1))), (LOOKUP_SORT,)),
+    ('player export', lambda db: next(iter_vods(check_names(db, CHECK_PLAYERS)[0]), None), (LOOKUP_SORT,)),
+    # A term matching more names than NAME_LOOKUP_LIMIT.
+    ('search term matching many names', lambda db: query_vod_page(*fts_condition('abcd', '', '', '', ''), '', 50, None), (SEARCH_SORT,)),
+    ('older search page', lambda db: search_vods('', '', 'clairen', '', '', cursor=encode_cursor('after', CHECK_CURSOR_DATE, 1)), (CHARACTER_LOOKUP, DATE_ORDER)),
+    # The trigram indexes can't look up terms shorter than three characters,
+    # so they're matched on the date index's rows.
+    ('short search term', lambda db: search_vods('ab', '', '', '', ''), (DATE_ORDER,)),
+    ('short term and event search', lambda db: search_vods('ab', '', '', '', check_names(db, CHECK_EVENTS)[0]), (LOOKUP_SORT,)),
+    # Exports read everything, in date order.
+    ('export', lambda db: next(iter_vods(), None), (DATE_ORDER,)),
+    ('full export', lambda db: next(export_rows(), None), (DATE_ORDER,)),
+    # Only the VODs added since the id are sorted.
+    ('export since id', lambda db: next(export_rows(since_id=1), None), ('USE TEMP B-TREE FOR ORDER BY',)),
+    ('export since date', lambda db: next(export_rows(since_date=datetime.fromisoformat(CHECK_CURSOR_DATE)), None), ()),
+    ('stats', lambda db: get_stats(), (
+        # The character list, and the matchup grid's row per character pair.
+        CHARACTER_LOOKUP, CHARACTER_SORT, 'SCAN matchup_stats',
+        # The top players and head-to-heads are read in order of their VOD
+        # counts up to the LIMIT, and only ties are sorted by name.
+        'SCAN player_stats USING COVERING INDEX idx_player_stats_vods',
+        'SCAN head_to_head_stats USING INDEX idx_head_to_head_stats_vods',
+        'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY',
+        # CHARACTER_SORT is also the sort of the top players' few characters
+        # each.
+    )),
+    # The suggestion indexes are rebuilt once per write generation from every
+    # player with VODs, and every event, each looked up on vod_listing.
+    ('suggestions', lambda db: (suggest('player', 'ab'), suggest('event', 'ab')), ('SCAN player_stats', 'SCAN event USING COVERING INDEX idx_event_name')),
+    ('vod lookup', lambda db: vod_exists('https://www.youtube.com/watch?v=aaaaaaaaaaa'), ()),
+    ('video keys', lambda db: existing_video_keys(db, [('youtube', 'aaaaaaaaaaa'), ('twitch', '1')]), ('SCAN wanted',)),
+    ('new player and event', lambda db: (ensure_player('check-plans'), ensure_event('check-plans')), ()),
+    ('new vod', lambda db: insert_vod(db, ensure_event('check-plans'), 'https://www.youtube.com/watch?v=aaaaaaaaaaa', ensure_player('check-plans'), ensure_player('check-plans'), 1, 2, 'Grand Finals', CHECK_CURSOR_DATE), ()),
+    ('submissions', lambda db: (insert_submissions(db, [('https://www.youtube.com/watch?v=aaaaaaaaaaa', None, None, None, None, None, None, None)]), pending_submissions(db)), ()),
+    ('channel sync', lambda db: get_channel_sync('channel', 'query'), ()),
+    # build-static reads the character list, totals the matchup grid and
+    # groups the VODs listed since its last build by matchup.
+    ('static build', lambda db: (character_names(), vods_listed_since(0)), (CHARACTER_LOOKUP, CHARACTER_SORT, 'SCAN matchup_stats', 'USE TEMP B-TREE FOR GROUP BY')),
+]
+
+def plan_problems(db, sql, params, allowed):
+    """Return the steps of a statement's query plan that scan a whole table or sort into a temporary b-tree."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')):
+        # Some pragmas take effect when they're prepared, even under EXPLAIN.
+        return []
+    if params is None:
+        # executemany; the values don't change the plan.
+        params = [None] * sql.count('?')
+    problems = []
+    for row in sqlite3.Cursor(db).execute('EXPLAIN QUERY PLAN ' + sql, params):
+        detail = row[3]
+        if 'CONSTANT ROW' in detail or ('VIRTUAL TABLE INDEX' in detail and ':M' in detail):
+            continue
+        # Reads a subquery's rows, whose own steps are checked.
+        if detail.startswith('SCAN (subquery-'):
+            continue
+        if (detail.startswith('SCAN') or 'TEMP B-TREE' in detail) and detail not in allowed:
+            problems.append(detail)
+    return problems
+
+def pending_submissions(db):
+    # Submissions are stored HTML-escaped, the way the form escaped them.
+    return [tuple(html.unescape(value) if isinstance(value, str) else value for value in row)
+            for row in db.cursor().execute("SELECT id,url,p1,c1,p2,c2,round,event,date FROM submission WHERE status = ?;", (NOT_REVIEWED_STATUS,))]
+
+def submission_info(id, url, p1, c1, p2, c2, event, round, date_str):
+    info = f"ID={id} URL={url}"
+    if p1:
+        info += f" p1=\"{p1}\""
+    if c1:
+        info += f" c1=\"{c1}\""
+    if p2:
+        info += f" p2=\"{p2}\""
+    if c2:
+        info += f" c2=\"{c2}\""
+    if event:
+        info += f" event=\"{event}\""
+    if round:
+        info += f" round=\"{round}\""
+    if date_str:
+        info += f" date=\"{date_str}\""
+    return info
+
+# Batch review rules, which a rules file can override.
+REVIEW_RULES = {
+    # Reject submissions of videos already on the site, or submitted earlier in the batch.
+    'reject_duplicates': True,
+    # Reject URLs that aren't YouTube or Twitch videos.
+    'reject_unsupported_urls': True,
+    # Only approve YouTube videos from the channels in data/channel_ids.txt,
+    # data/regular_queries.txt or `channels`. Needs the YouTube API.
+    'require_known_channel': True,
+    'channels': [],
+    # Only approve submissions with an event, or a date (which can come from the API).
+    'require_event': True,
+    'require_date': False,
+}
+
+def load_review_rules(filename):
+    with open(filename, encoding='utf-8') as f:
+        rules = json.load(f)
+    unknown = set(rules) - set(REVIEW_RULES)
+    if unknown:
+        raise click.ClickException(f"Unknown review rules: {', '.join(sorted(unknown))}")
+    return {**REVIEW_RULES, **rules}
+
+def known_channel_ids(extra=()):
+    import youtube
+
+    channels = set(extra)
+    channels.update(channel_id for _, channel_id, _ in youtube.read_channel_ids('data/channel_ids.txt'))
+    channels.update(channel_id for channel_id, _ in youtube.read_regular_queries('data/regular_queries.txt'))
+    return channels
+
+def review_submission(rules, submission, key, duplicate, snippet, channels):
+    """Decide what a batch review does with a submission.
+
+    `snippet` is the YouTube API's snippet for the video, if it was looked up.
+    Both players and known characters are always needed to approve. Returns ('approve', []), ('reject', reasons) or ('review', reasons) for
+    submissions that need a human.
+    """
+    id, url, p1, c1, p2, c2, round, event, date_str = submission
+    platform, _ = key
+    if rules['reject_unsupported_urls'] and platform == 'url':
+        return 'reject', ['not a YouTube or Twitch video']
+    if rules['reject_duplicates'] and duplicate:
+        return 'reject', ['video is already on the site']
+
+    reasons = []
+    if rules['require_known_channel']:
+        if snippet is None:
+            reasons.append('channel unknown')
+        elif snippet.get('channelId') not in channels:
+            reasons.append(f"channel \"{snippet.get('channelTitle')}\" isn't a known channel")
+    if not p1 or not p2:
+        reasons.append('missing a player')
+    if not (c1 and get_character_id(c1) and c2 and get_character_id(c2)):
+        reasons.append('missing or unknown character')
+    if rules['require_event'] and not event:
+        reasons.append('missing event')
+    if rules['require_date'] and not parse_date(date_str) and not (snippet and snippet.get('publishedAt')):
+        reasons.append('missing date')
+    return ('review' if reasons else 'approve'), reasons
+
+def reviewed_vod_problem(p1, c1, p2, c2):
+    """Return why a reviewed submission can't be added as it is, or None."""
+    if not p1 or not p2:
+        return 'Both players need a tag.'
+    for c in (c1, c2):
+        if not c or get_character_id(c) is None:
+            return f'Unknown character "{c or ""}".'
+    return None
+
+def approve_reviewed(db, id, url, p1, c1, p2, c2, event, round, vod_date):
+    """Add a submission approved in review-submissions and mark it approved.
+
+    A video that's already in the archive is rejected instead. Returns False,
+    leaving the submission as it was, if it can't be added as it is.
+    """
+    if vod_exists(url):
+        click.echo('That video is already in the database, rejecting.')
+        db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (REJECTED_STATUS, id,))
+        db.commit()
+        return True
+    problem = reviewed_vod_problem(p1, c1, p2, c2)
+    if problem:
+        click.echo(f'{problem} Edit the submission to fix it.')
+        return False
+    insert_vod(db, ensure_event(event or 'Unknown'), url, ensure_player(p1), ensure_player(p2), get_character_id(c1), get_character_id(c2),
+               round, vod_date, submission_id=id)
+    db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (APPROVED_STATUS, id,))
+    db.commit()
+    return True
+
+def review_submissions_batch(rules, client, dry_run=False, report=None):
+    """Approve and reject the unreviewed submissions by `rules` in one transaction.
+
+    Players and events are resolved against maps loaded up front. Prints what
+    happened to each submission, and returns the ones left for a human.
+    """
+    db = get_db()
+    submissions = pending_submissions(db)
+    keys = {submission[0]: canonical_video_key(submission[1]) for submission in submissions}
+    existing = existing_video_keys(db, keys.values())
+
+    snippets = {}
+    youtube_ids = [video_id for platform, video_id in keys.values() if platform == 'youtube' and (platform, video_id) not in existing]
+    if rules['require_known_channel'] and youtube_ids:
+        try:
+            snippets = client.videos(youtube_ids)
+        except Exception as e:
+            click.echo(f"Couldn't look up the videos' channels, leaving them for review: {e}")
+    channels = known_channel_ids(rules['channels'])
+
+    decisions = []
+    for submission in submissions:
+        key = keys[submission[0]]
+        snippet = snippets.get(key[1]) if key[0] == 'youtube' else None
+        action, reasons = review_submission(rules, submission, key, key in existing, snippet, channels)
+        if action == 'approve':
+            existing.add(key)
+        decisions.append((submission, snippet, action, reasons))
+
+    approved = [(submission, snippet) for submission, snippet, action, _ in decisions if action == 'approve']
+    players = {tag: id for id, tag in db.cursor().execute("SELECT id, tag FROM player;")}
+    events = {name: id for id, name in db.cursor().execute("SELECT id, name FROM event;")}
+    insert_names(db, 'player', 'tag', [submission[2] for submission, _ in approved] + [submission[4] for submission, _ in approved], players)
+    insert_names(db, 'event', 'name', [submission[7] or 'Unknown' for submission, _ in approved], events)
+    for (id, url, p1, c1, p2, c2, round, event, date_str), snippet in approved:
+        vod_date = parse_date(date_str)
+        if vod_date is None and snippet and snippet.get('publishedAt'):
+            vod_date = datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00'))
+        insert_vod(db, events[event or 'Unknown'], url, players[p1], players[p2], get_character_id(c1), get_character_id(c2),
+                   round, vod_date_text(vod_date), submission_id=id)
+    db.cursor().executemany('UPDATE submission SET status = ? WHERE id = ?;', [
+        (APPROVED_STATUS if action == 'approve' else REJECTED_STATUS, submission[0])
+        for submission, _, action, _ in decisions if action != 'review'
+    ])
+
+    leftovers = []
+    for submission, _, action, reasons in decisions:
+        id, url, p1, c1, p2, c2, round, event, date_str = submission
+        prefix = {'approve': '+', 'reject': '-', 'review': '?'}[action]
+        click.echo(f"{prefix} {submission_info(id, url, p1, c1, p2, c2, event, round, date_str)}" + (f" ({'; '.join(reasons)})" if reasons else ''))
+        if action == 'review':
+            leftovers.append((submission, reasons))
+    counts = {action: sum(1 for _, _, a, _ in decisions if a == action) for action in ('approve', 'reject', 'review')}
+    click.echo(f"Approved {counts['approve']}, rejected {counts['reject']}, left {counts['review']} for review.")
+
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            for (id, url, p1, c1, p2, c2, round, event, date_str), reasons in leftovers:
+                f.write(json.dumps({'id': id, 'url': url, 'p1': p1, 'c1': c1, 'p2': p2, 'c2': c2, 'event': event, 'round': round, 'date': date_str, 'reasons': reasons}) + '\n')
+    if dry_run:
+        db.rollback()
+        click.echo('Dry run, nothing was changed.')
+    else:
+        db.commit()
+    return leftovers
+
 @click.command('review-submissions')
-def review_submissions_command():
+@click.option('--batch', is_flag=True, help="Approve and reject by the rules file without asking, leaving the rest for later.")
+@click.option('--rules', default='data/review_rules.json', help='Rules for --batch.')
+@click.option('--dry-run', is_flag=True, help="With --batch, report what would happen without changing anything.")
+@click.option('--report', default=None, help='With --batch, write the submissions left for review here as JSON lines.')
+@click.option('--cache-dir', default=None, help='Save API responses here and reuse them on later runs.')
+@click.option('--offline', is_flag=True, help='Only use responses from --cache-dir.')
+@click.option('--api-url', envvar='YOUTUBE_API_URL', default='https://www.googleapis.com/youtube/v3', help='YouTube Data API base URL.')
+def review_submissions_command(batch, rules, dry_run, report, cache_dir, offline, api_url):
+    """Approve or reject the VOD submissions from the site."""
+    # Submissions a crashed server hadn't written yet.
+    submission_queue.wait_for_replay()
+    if batch:
+        review_submissions_batch(load_review_rules(rules), youtube_client(api_url, cache_dir, offline), dry_run, report)
+        return
+
     db = get_db()
-    submissions = db.cursor().execute("SELECT id,url,p1,c1,p2,c2,round,event,date FROM submission WHERE status = ?;", (NOT_REVIEWED_STATUS,)).fetchall()
+    submissions = pending_submissions(db)
     click.echo(f"{len(submissions)} submissions to review.")
-    # TODO: Support dates.
     for (id,url,p1,c1,p2,c2,round,event,date_str) in submissions:
         while True:
-            # Build the info string.
-            def display_info(id, url, p1, c1, p2, c2, event, round, date_str):
-                info = f"ID={id} URL={url}"
-                if p1:
-                    info += f" p1=\"{p1}\""
-                if c1:
-                    info += f" c1=\"{c1}\""
-                if p2:
-                    info += f" p2=\"{p2}\""
-                if c2:
-                    info += f" c2=\"{c2}\""
-                if event:
-                    info += f" event=\"{event}\""
-                if round:
-                    info += f" round=\"{round}\""
-                if date_str:
-                    info += f" date=\"{date_str}\""
-                click.echo(info)
-            display_info(id, url, p1, c1, p2, c2, event, round, date_str)
+            click.echo(submission_info(id, url, p1, c1, p2, c2, event, round, date_str))
             action = input("Approve [A] Edit [E] Skip [S] Reject [R]: ").lower()
             if action == 'a':
-                event_id = ensure_event(event)
-                p1_id = ensure_player(p1)
-                p2_id = ensure_player(p2)
-                c1_id = get_character_id(c1) or ''
-                c2_id = get_character_id(c2) or ''
                 vod_date = parse_date(date_str) or None
-                db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (APPROVED_STATUS, id,))
-                db.cursor().execute('''
-                                    INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                                    VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);''',
-                                    (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else ''))
-                db.commit()
-                break
+                if approve_reviewed(db, id, url, p1, c1, p2, c2, event, round, vod_date_text(vod_date)):
+                    break
             elif action == 'r':
                 db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (REJECTED_STATUS, id,))
                 db.commit()
@@ -292,208 +1734,604 @@ def review_submissions_command():
                 date_str = prompt('Date (MM/DD/YY)', date_str)
                 vod_date = parse_date(date_str) or None
 
-                display_info(id, url, p1, c1, p2, c2, event, round, date_str)
+                click.echo(submission_info(id, url, p1, c1, p2, c2, event, round, date_str))
                 response = input('Commit this to the database? [y/n] ')
                 if response in ['y', 'yes']:
-                    p1_id = ensure_player(p1)
-                    p2_id = ensure_player(p2)
-                    c1_id = get_character_id(c1)
-                    c2_id = get_character_id(c2)
-                    event_id = ensure_event(event)
-
-                    db.cursor().execute('''
-                        INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                        VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);''',
-                        (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else ''))
-                    
-                    db.commit()
+                    if not approve_reviewed(db, id, url, p1, c1, p2, c2, event, round, vod_date_text(vod_date)):
+                        continue
 
                 break
             else:
                 click.echo('Unknown action.')
 
+# Copies VODs into vod_listing. Append a WHERE clause on vod to limit it.
+LISTING_INSERT = """
+INSERT INTO vod_listing (id, url, event_id, p1_id, c1_id, p2_id, c2_id, p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url, event_name, round, vod_date)
+SELECT vod.id, vod.url, e.id, p1.id, c1.id, p2.id, c2.id, p1.tag, c1.name, c1.icon_url, p2.tag, c2.name, c2.icon_url, e.name, vod.round, COALESCE(vod.vod_date, '')
+FROM vod
+    INNER JOIN event e ON e.id = vod.event_id
+    INNER JOIN player p1 ON p1.id = vod.p1_id
+    INNER JOIN player p2 ON p2.id = vod.p2_id
+    INNER JOIN game_character c1 ON c1.id = vod.c1_id
+    INNER JOIN game_character c2 ON c2.id = vod.c2_id
+"""
+
+# Add the VODs in vod_listing matching a WHERE clause to the stats tables.
+# The UNIONs count a VOD once for a player who somehow appears on both sides.
+STATS_INSERTS = [
+    """
+    INSERT INTO matchup_stats (c1_id, c2_id, vods)
+    SELECT min(c1_id, c2_id), max(c1_id, c2_id), count(*) FROM vod_listing {where} GROUP BY 1, 2
+    ON CONFLICT (c1_id, c2_id) DO UPDATE SET vods = vods + excluded.vods;
+    """,
+    """
+    INSERT INTO player_stats (player_id, vods)
+    SELECT player_id, count(*) FROM (
+        SELECT id, p1_id AS player_id FROM vod_listing {where}
+        UNION SELECT id, p2_id FROM vod_listing {where}
+    ) WHERE true GROUP BY player_id
+    ON CONFLICT (player_id) DO UPDATE SET vods = vods + excluded.vods;
+    """,
+    """
+    INSERT INTO player_character_stats (player_id, character_id, vods)
+    SELECT player_id, character_id, count(*) FROM (
+        SELECT id, p1_id AS player_id, c1_id AS character_id FROM vod_listing {where}
+        UNION SELECT id, p2_id, c2_id FROM vod_listing {where}
+    ) WHERE true GROUP BY player_id, character_id
+    ON CONFLICT (player_id, character_id) DO UPDATE SET vods = vods + excluded.vods;
+    """,
+    """
+    INSERT INTO head_to_head_stats (p1_id, p2_id, vods)
+    SELECT min(p1_id, p2_id), max(p1_id, p2_id), count(*) FROM vod_listing {where} GROUP BY 1, 2
+    ON CONFLICT (p1_id, p2_id) DO UPDATE SET vods = vods + excluded.vods;
+    """,
+]
+
+def add_stats(db, where='WHERE true', params=()):
+    for statement in STATS_INSERTS:
+        db.cursor().execute(statement.format(where=where), tuple(params) * statement.count('{where}'))
+
+def rebuild_stats(db):
+    """Recompute the stats tables from vod_listing without committing."""
+    for table in ('matchup_stats', 'player_stats', 'player_character_stats', 'head_to_head_stats'):
+        db.cursor().execute(f"DELETE FROM {table};")
+    add_stats(db)
+
+def bulk_insert_vods(db, rows):
+    """Insert many VODs at once without committing.
+
+    `rows` are (event_id, url, platform, video_id, p1_id, p2_id, c1_id, c2_id,
+    round, vod_date) tuples, with the video key from canonical_video_key.
+    Rows whose video is already in the archive are skipped. The per-row
+    triggers are switched off for the insert and vod_listing and vod_search
+    are caught up afterwards with one statement each, and the stats tables
+    with one per table, which is several times faster for large batches.
+    Everything happens in the caller's transaction, so other connections
+    never see the switch.
+    """
+    if not rows:
+        return
+    last_id = db.cursor().execute("SELECT coalesce(max(id), 0) FROM vod;").fetchone()[0]
+    db.cursor().execute("UPDATE bulk_load SET active = 1 WHERE id = 1;")
+    db.cursor().executemany("""
+                   INSERT OR IGNORE INTO vod (game_id, event_id, url, platform, video_id, p1_id, p2_id, c1_id, c2_id, round, vod_date)
+                   VALUES                    (?,       ?,        ?,   ?,        ?,        ?,     ?,     ?,     ?,     ?,     ?);
+                   """, [(RIVALS_OF_AETHER_TWO, *row) for row in rows])
+    db.cursor().execute(LISTING_INSERT + "WHERE vod.id > ?;", (last_id,))
+    db.cursor().execute("""
+    INSERT INTO vod_search (rowid, p1_tag, p2_tag, c1_name, c2_name, event_name, round)
+    SELECT id, p1_tag, p2_tag, c1_name, c2_name, event_name, round FROM vod_listing WHERE id > ?;
+    """, (last_id,))
+    add_stats(db, "WHERE id > ?", (last_id,))
+    db.cursor().execute("UPDATE write_generation SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;")
+    db.cursor().execute("UPDATE bulk_load SET active = 0 WHERE id = 1;")
+
+@contextmanager
+def bulk_load_pragmas(db):
+    """Tune the connection for a large load, restoring it afterwards."""
+    synchronous = db.cursor().execute("PRAGMA synchronous;").fetchone()[0]
+    cache_size = db.cursor().execute("PRAGMA cache_size;").fetchone()[0]
+    db.cursor().execute("PRAGMA journal_mode = WAL;")
+    db.cursor().execute("PRAGMA synchronous = NORMAL;")
+    db.cursor().execute("PRAGMA cache_size = -262144;")
+    try:
+        yield
+    finally:
+        db.cursor().execute(f"PRAGMA synchronous = {int(synchronous)};")
+        db.cursor().execute(f"PRAGMA cache_size = {int(cache_size)};")
+
+def insert_names(db, table, column, names, ids):
+    """Insert names missing from the name -> id map `ids` and add their IDs to it."""
+    names = [name for name in dict.fromkeys(names) if name not in ids]
+    if not names:
+        return
+    last_id = db.cursor().execute(f"SELECT coalesce(max(id), 0) FROM {table};").fetchone()[0]
+    db.cursor().executemany(f"INSERT INTO {table} ({column}) VALUES (?);", [(name,) for name in names])
+    ids.update((name, id) for id, name in db.cursor().execute(f"SELECT id, {column} FROM {table} WHERE id > ?;", (last_id,)))
+
 @click.command('ingest-csv')
 @click.argument('filename')
-def ingest_csv_command(filename):
+@click.option('--chunk-size', default=50000, help='Rows to insert per transaction.')
+def ingest_csv_command(filename, chunk_size):
+    """Add the VODs in a CSV file that aren't in the database yet."""
     import csv
+    from itertools import islice
 
     db = get_db()
+    start = time.perf_counter()
+
+    # Resolve everything in memory instead of querying per row.
+    players = {tag: id for id, tag in db.cursor().execute("SELECT id, tag FROM player;")}
+    events = {name: id for id, name in db.cursor().execute("SELECT id, name FROM event;")}
+    keys = set(tuple(row) for row in db.cursor().execute("SELECT platform, video_id FROM vod;"))
+
+    num_rows = 0
     num_vods = 0
-    with open(filename) as csvfile:
-        for url, p1, c1, p2, c2, event, round, vod_time in csv.reader(csvfile):
-            if vod_exists(url):
-                click.echo(f"Skipping existing vod {url}.")
-                continue
+    num_existing = 0
+    num_unknown = 0
+    with bulk_load_pragmas(db), open(filename, newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                break
+            num_rows += len(chunk)
 
-            p1_id = ensure_player(p1)
-            p2_id = ensure_player(p2)
-            event_id = ensure_event(event)
-            c1_id = get_character_id(c1)
-            c2_id = get_character_id(c2)
-
-            num_vods += 1
-            db.cursor().execute("""
-                              INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                              VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);
-                              """, (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_time,))
-    db.commit()
-    click.echo(f"Ingested {num_vods} vods.")
+            rows = []
+            for url, p1, c1, p2, c2, event, round, vod_time in chunk:
+                key = canonical_video_key(url)
+                if key in keys:
+                    num_existing += 1
+                    continue
+                c1_id = get_character_id(c1)
+                c2_id = get_character_id(c2)
+                if not c1_id or not c2_id:
+                    click.echo(f"Skipping vod {url} with unknown character {c1 if not c1_id else c2}.")
+                    num_unknown += 1
+                    continue
+                keys.add(key)
+                rows.append((url, key, p1, c1_id, p2, c2_id, event, round, vod_time))
 
-@click.command('ingest-channel')
-@click.argument('channel_id')
-@click.argument('query')
-@click.argument('format')
-def ingest_channel_command(channel_id, query, format):
-    import googleapiclient.discovery
-    import googleapiclient.errors
-    import os
-    import re
-
-    scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
-
-    # Disable OAuthlib's HTTPS verification when running locally.
-    # *DO NOT* leave this option enabled in production.
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
-
-    api_service_name = "youtube"
-    api_version = "v3"
-    api_key = None
-    with open('youtube_api_key') as f:
-        api_key = f.readline().strip()
-
-    youtube = googleapiclient.discovery.build(
-        api_service_name, api_version, developerKey=api_key)
-
-    def get_page(page_token=None):
-        request = youtube.search().list(
-            part="snippet",
-            maxResults=50,
-            channelId=channel_id,
-            q=query,
-            pageToken=page_token
-        )
-        return request.execute()
-
-    format_regex_str = (re.escape(format)
-                    .replace('%SIDE', '(([\s*W\s*])|([\s*L\s*]))')
-                    .replace('%E', '(?P<event>[\s*#*\(*\s*\w~#&;\-:\)*]+)')
-                    .replace('%P1', '(?P<p1>[\s*\w\$|&;~!?#.@\-\+]+)')
-                    .replace('%P2', '(?P<p2>[\s*\w\$|&;~!?#.@\-\+]+)')
-                    .replace('%C1', '(?P<c1>[\s*\w/*,*]+)')
-                    .replace('%C2', '(?P<c2>[\s*\w/*,*]+)')
-                    .replace('%V', '((vs.)|(vs)|(Vs.)|(VS.)|(Vs)|(VS))')
-                    .replace('%ROA', '((RoA2)|(ROA2)|(Rivals II)|(Rivals 2)|(Rivals of Aether 2)|(Rivals of Aether II)|(Rivals II Bracket)|(Rivals 2 Bracket))?')
-                    .replace('%R', '(?P<round>[\s*\(*\s*\w\-#&;\)*]+)'))
-    print(format_regex_str)
-    format_regex = re.compile(format_regex_str)
+            insert_names(db, 'player', 'tag', [row[2] for row in rows] + [row[4] for row in rows], players)
+            insert_names(db, 'event', 'name', [row[6] for row in rows], events)
+            bulk_insert_vods(db, [(events[event], url, *key, players[p1], players[p2], c1_id, c2_id, round, vod_time)
+                                  for url, key, p1, c1_id, p2, c2_id, event, round, vod_time in rows])
+            db.commit()
+            num_vods += len(rows)
+
+            elapsed = time.perf_counter() - start
+            click.echo(f"{num_rows} rows read, {num_vods} vods ingested ({num_rows / elapsed:.0f} rows/s).")
+
+    elapsed = time.perf_counter() - start
+    click.echo(f"Skipped {num_existing} existing and {num_unknown} unrecognized vods.")
+    click.echo(f"Ingested {num_vods} vods in {elapsed:.1f}s.")
 
+def get_channel_sync(channel_id, query):
+    """Return (published_after, page_token) for where the last ingest-channel run stopped."""
     db = get_db()
+    entry = db.cursor().execute("SELECT published_after, page_token FROM channel_sync WHERE channel_id = ? AND query = ?;", (channel_id, query)).fetchone()
+    return (entry[0], entry[1]) if entry else (None, None)
 
-    def ingest_page(page):
-        items = page.get('items')
-        if not items:
-            return 0
-        
-        results = []
-        for item in items:
-            # Ignore playlists, just grab videos.
-            if not item.get('id') or not item['id'].get('videoId'):
-                continue
-            video_id = item['id']['videoId']
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            snippet = item['snippet']
-            published_at = snippet['publishedAt']
-            title = snippet['title']
-
-            existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
-            if existing_vod:
-                click.echo(f'ALREADY PRESENT: {title}')
-                continue
+def save_channel_sync(fetch, published_after, skipped=None):
+    """Record how far a channel fetch got. Doesn't commit.
 
-            info = format_regex.match(title.strip())
-            if not info:
-                click.echo(f'DOES NOT MATCH: {title}')
-                continue
-            p1 = info.group('p1')
-            p2 = info.group('p2')
+    `skipped`, the items of the videos to try again next time, replaces the
+    search's earlier ones if it's given, since those were tried again along
+    with the fetch.
+    """
+    db = get_db()
+    entry = db.cursor().execute("SELECT high_water FROM channel_sync WHERE channel_id = ? AND query = ?;", (fetch.channel_id, fetch.query)).fetchone()
+    # A resumed walk only sees the later pages, so keep the newest date either run saw.
+    high_water = max(filter(None, [fetch.high_water, entry[0] if entry else None]), default=None)
+    if fetch.error:
+        # Keep the same lower bound and resume from the page that failed.
+        page_token = fetch.resume_token
+    else:
+        published_after = high_water
+        page_token = None
+    db.cursor().execute("""
+    INSERT INTO channel_sync (channel_id, query, published_after, page_token, high_water, updated_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (channel_id, query) DO UPDATE SET
+        published_after = excluded.published_after,
+        page_token = excluded.page_token,
+        high_water = excluded.high_water,
+        updated_at = excluded.updated_at;
+    """, (fetch.channel_id, fetch.query, published_after, page_token, high_water))
+    if skipped is None:
+        return
+    db.cursor().execute("DELETE FROM channel_skipped_video WHERE channel_id = ? AND query = ?;", (fetch.channel_id, fetch.query))
+    db.cursor().executemany("""
+    INSERT OR REPLACE INTO channel_skipped_video (channel_id, query, video_id, title, published_at)
+    VALUES (?, ?, ?, ?, ?);
+    """, [(fetch.channel_id, fetch.query, item['id']['videoId'], item['snippet']['title'], item['snippet']['publishedAt']) for item in skipped])
 
-            c1 = None
-            if info.groupdict().get('c1'):
-                c1 = info.group('c1').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
-            else:
-                c1 = prompt(f"c1 for {url}")
-            c2 = None
-            if info.groupdict().get('c2'):
-                c2 = info.group('c2').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
-            else:
-                c2 = prompt(f"c2 for {url}")
-            event = info.groupdict().get('event') or 'Unknown'
-            round = info.groupdict().get('round') or ''
-
-            # TODO: Parse round name info.
-            event_id = ensure_event(event)
-            p1_id = ensure_player(p1)
-            p2_id = ensure_player(p2)
-            c1_id = get_character_id(c1)
-            if not c1_id:
-                # click.echo(f"Unknown character {c1} for {url}, skipping VOD.")
-                continue
+def skipped_channel_items(channel_id, query):
+    """Return the videos earlier runs of a channel search couldn't add, as search result items."""
+    db = get_db()
+    return [{'id': {'videoId': video_id}, 'snippet': {'title': title, 'publishedAt': published_at}}
+            for video_id, title, published_at in db.cursor().execute(
+                "SELECT video_id, title, published_at FROM channel_skipped_video WHERE channel_id = ? AND query = ? ORDER BY published_at;",
+                (channel_id, query))]
 
-            c2_id = get_character_id(c2)
-            if not c2_id:
-                # click.echo(f"Unknown character {c2} for {url}, skipping VOD.")
-                continue
+def youtube_client(api_url, cache_dir, offline):
+    import youtube
 
-            result = f'p1={p1} c1={c1} p2={p2} c2={c2} event={event} round={round} vod_date={published_at} url={url}'
-            click.echo(result)
-            results.append(result)
+    api_key = os.environ.get('YOUTUBE_API_KEY')
+    if not api_key and os.path.exists('youtube_api_key'):
+        with open('youtube_api_key') as f:
+            api_key = f.readline().strip()
+    return youtube.YouTubeClient(api_key, api_url=api_url, cache_dir=cache_dir, offline=offline)
 
-            db.cursor().execute("""
-                              INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round)
-                              VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,        ?);
-                              """, (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, published_at, round,))
-        
-        return results
+def ingest_channel_items(items, format_regexes, interactive=True, skipped=None):
+    """Insert the videos in a channel's search results that match one of its title formats.
+
+    Returns a description of each VOD added. The items of videos that
+    weren't added, and aren't already, go in `skipped` if it's given.
+    Doesn't commit.
+    """
+    import youtube
+
+    db = get_db()
+    if skipped is None:
+        skipped = []
+    videos = []
+    for item in items:
+        # Ignore playlists, just grab videos.
+        if not item.get('id') or not item['id'].get('videoId'):
+            continue
+        videos.append((f"https://www.youtube.com/watch?v={item['id']['videoId']}", item))
+
+    # One lookup for the whole batch instead of one per video.
+    existing = existing_video_keys(db, [canonical_video_key(url) for url, _ in videos])
 
-    
-    page = get_page()
     results = []
-    results += ingest_page(page)
-    while page.get('nextPageToken'):
-        page = get_page(page['nextPageToken'])
-        results += ingest_page(page)
-    
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "0"
+    for url, item in videos:
+        published_at = item['snippet']['publishedAt']
+        title = item['snippet']['title']
+
+        if canonical_video_key(url) in existing:
+            click.echo(f'ALREADY PRESENT: {title}')
+            continue
+
+        info = None
+        for format_regex in format_regexes:
+            info = youtube.parse_title(format_regex, title)
+            if info:
+                break
+        if not info:
+            click.echo(f'DOES NOT MATCH: {title}')
+            skipped.append(item)
+            continue
+
+        c1 = info['c1']
+        c2 = info['c2']
+        if not interactive and (not c1 or not c2):
+            click.echo(f'NO CHARACTERS: {title}')
+            skipped.append(item)
+            continue
+        if not c1:
+            c1 = prompt(f"c1 for {url}")
+        if not c2:
+            c2 = prompt(f"c2 for {url}")
+        p1 = info['p1']
+        p2 = info['p2']
+        event = info['event']
+        round = info['round']
+
+        # TODO: Parse round name info.
+        c1_id = get_character_id(c1)
+        if not c1_id:
+            # click.echo(f"Unknown character {c1} for {url}, skipping VOD.")
+            skipped.append(item)
+            continue
+
+        c2_id = get_character_id(c2)
+        if not c2_id:
+            # click.echo(f"Unknown character {c2} for {url}, skipping VOD.")
+            skipped.append(item)
+            continue
+        event_id = ensure_event(event)
+        p1_id = ensure_player(p1)
+        p2_id = ensure_player(p2)
+
+        result = f'p1={p1} c1={c1} p2={p2} c2={c2} event={event} round={round} vod_date={published_at} url={url}'
+        click.echo(result)
+        results.append(result)
+        existing.add(canonical_video_key(url))
+
+        insert_vod(db, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date_text(datetime.fromisoformat(published_at.replace('Z', '+00:00'))))
+    return results
+
+@click.command('ingest-channel')
+@click.argument('channel_id')
+@click.argument('query')
+@click.argument('format')
+@click.option('--full', is_flag=True, help='Walk the whole channel instead of only videos since the last run.')
+@click.option('--yes', is_flag=True, help="Commit without asking, and skip videos that would need a prompt.")
+@click.option('--cache-dir', default=None, help='Save API responses here and reuse them on later runs.')
+@click.option('--offline', is_flag=True, help='Only use responses from --cache-dir.')
+@click.option('--api-url', envvar='YOUTUBE_API_URL', default='https://www.googleapis.com/youtube/v3', help='YouTube Data API base URL.')
+def ingest_channel_command(channel_id, query, format, full, yes, cache_dir, offline, api_url):
+    """Add VODs from a YouTube channel's videos whose titles match FORMAT."""
+    import youtube
+
+    client = youtube_client(api_url, cache_dir, offline)
+    format_regex = youtube.title_format_regex(format)
+    print(format_regex.pattern)
+
+    published_after, page_token = (None, None) if full else get_channel_sync(channel_id, query)
+    if page_token:
+        click.echo("Resuming the last run.")
+    elif published_after:
+        click.echo(f"Fetching videos published after {published_after}.")
+    fetch, = youtube.fetch_channels(client, [(channel_id, query, published_after, page_token)])
+    if fetch.error:
+        click.echo(f"Stopped after {len(fetch.items)} videos: {fetch.error}")
+
+    db = get_db()
+    # Videos earlier runs skipped are behind the high-water mark, so the
+    # fetch won't see them again.
+    retries = skipped_channel_items(channel_id, query)
+    if retries:
+        click.echo(f"Trying {len(retries)} skipped videos again.")
+    skipped = []
+    results = ingest_channel_items(retries + fetch.items, [format_regex], interactive=not yes, skipped=skipped)
 
     click.echo('\n'.join(results))
-    response = input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
+    response = 'y' if yes else input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
     if response in ['y', 'yes']:
+        save_channel_sync(fetch, published_after, skipped)
         db.commit()
     else:
         click.echo('Aborting.')
         return
 
+@click.command('ingest-all')
+@click.argument('filename', default='data/regular_queries.txt')
+@click.option('--full', is_flag=True, help='Walk the whole channels instead of only videos since the last run.')
+@click.option('--workers', default=8, help='Channels to fetch at once.')
+@click.option('--cache-dir', default=None, help='Save API responses here and reuse them on later runs.')
+@click.option('--offline', is_flag=True, help='Only use responses from --cache-dir.')
+@click.option('--api-url', envvar='YOUTUBE_API_URL', default='https://www.googleapis.com/youtube/v3', help='YouTube Data API base URL.')
+def ingest_all_command(filename, full, workers, cache_dir, offline, api_url):
+    """Run every ingest-channel query in FILENAME without prompting.
+
+    Queries for the same channel are fetched once and each title is tried
+    against all of that channel's formats, along with the videos earlier runs
+    skipped. Each channel is committed in its own transaction.
+    """
+    import youtube
+
+    client = youtube_client(api_url, cache_dir, offline)
+    queries = youtube.read_regular_queries(filename)
+
+    jobs = []
+    for channel_id, query in queries:
+        published_after, page_token = (None, None) if full else get_channel_sync(channel_id, query)
+        jobs.append((channel_id, query, published_after, page_token))
+    fetches = youtube.fetch_channels(client, jobs, max_workers=workers)
+
+    db = get_db()
+    total = 0
+    for (channel_id, query, published_after, _), fetch in zip(jobs, fetches):
+        formats = queries[(channel_id, query)]
+        click.echo(f"{channel_id} {query}: {len(fetch.items)} videos, {len(formats)} formats.")
+        if fetch.error:
+            click.echo(f"Stopped early: {fetch.error}")
+        # As in ingest-channel, skipped videos are behind the high-water mark.
+        retries = skipped_channel_items(channel_id, query)
+        if retries:
+            click.echo(f"Trying {len(retries)} skipped videos again.")
+        skipped = []
+        results = ingest_channel_items(retries + fetch.items, [youtube.title_format_regex(format) for format in formats], interactive=False, skipped=skipped)
+        save_channel_sync(fetch, published_after, skipped)
+        db.commit()
+        total += len(results)
+    click.echo(f"Ingested {total} vods from {len(jobs)} channel queries.")
+
+def merge_duplicate_vods(db, dry_run=False):
+    """Merge VODs whose URLs point at the same video and index the rest by video, without committing.
+
+    The oldest VOD of each video is kept, picking up a date, round or
+    submission from its duplicates if it lacks one. Also adds the platform
+    and video_id columns to databases created before they existed. Returns
+    how many duplicates there were.
+    """
+    columns = [row[1] for row in db.cursor().execute("PRAGMA table_info(vod);")]
+    key_columns = 'platform, video_id'
+    if 'platform' not in columns:
+        key_columns = 'NULL, NULL'
+        if not dry_run:
+            db.cursor().execute("ALTER TABLE vod ADD COLUMN platform TEXT;")
+            db.cursor().execute("ALTER TABLE vod ADD COLUMN video_id TEXT;")
+
+    videos = {}
+    for id, url, platform, video_id, vod_date, round, submission_id in db.cursor().execute(f"""
+    SELECT id, url, {key_columns}, CAST(vod_date AS TEXT), round, submission_id FROM vod ORDER BY id;
+    """):
+        key = canonical_video_key(url)
+        videos.setdefault(key, []).append((id, url, (platform, video_id) != key, vod_date, round, submission_id))
+
+    num_merged = 0
+    updates = []
+    for key, vods in videos.items():
+        id, url, stale, vod_date, round, submission_id = vods[0]
+        if stale:
+            updates.append((*key, id))
+        if len(vods) == 1:
+            continue
+        click.echo(f"{url}: keeping {id}, merging {', '.join(str(vod[0]) for vod in vods[1:])}")
+        num_merged += len(vods) - 1
+        if dry_run:
+            continue
+        vod_date = vod_date or next((vod[3] for vod in vods if vod[3]), None)
+        round = round or next((vod[4] for vod in vods if vod[4]), None)
+        submission_id = submission_id or next((vod[5] for vod in vods if vod[5]), None)
+        db.cursor().executemany("DELETE FROM vod WHERE id = ?;", [(vod[0],) for vod in vods[1:]])
+        db.cursor().execute("UPDATE vod SET vod_date = ?, round = ?, submission_id = ? WHERE id = ?;", (vod_date, round, submission_id, id))
+
+    if dry_run:
+        return num_merged
+    db.cursor().executemany("UPDATE vod SET platform = ?, video_id = ? WHERE id = ?;", updates)
+    db.cursor().execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_vod_video ON vod (platform, video_id);")
+    return num_merged
+
+@click.command('merge-duplicate-vods')
+@click.option('--dry-run', is_flag=True, help='Only list the duplicates.')
+def merge_duplicate_vods_command(dry_run):
+    """Merge VODs whose URLs point at the same video and index the rest by video.
+
+    The oldest VOD of each video is kept, picking up a date, round or
+    submission from its duplicates if it lacks one.
+    """
+    db = get_db()
+    num_merged = merge_duplicate_vods(db, dry_run)
+    if dry_run:
+        db.rollback()
+        click.echo(f"Found {num_merged} duplicate vods.")
+        return
+    db.commit()
+    click.echo(f"Merged {num_merged} duplicate vods.")
+
+# Rows read from the database at a time while exporting.
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ('url', 'p1_tag', 'c1_name', 'p2_tag', 'c2_name', 'event_name', 'round', 'vod_date')
+
+def export_rows(since_id=None, since_date=None):
+    """Yield (id, url, p1_tag, c1_name, p2_tag, c2_name, event_name, round, vod_date)
+    for the listed VODs, oldest first, reading EXPORT_CHUNK_SIZE rows at a time.
+
+    Only the VODs after `since_id`, or from the datetime `since_date`, are
+    exported if either is given.
+    """
+    where = ''
+    params = ()
+    order = 'vod_date ASC, id ASC'
+    if since_id is not None:
+        where, params = 'WHERE id > ?', (since_id,)
+        # Sort just the new rows, rather than walk the date index past every old one.
+        order = '+vod_date ASC, id ASC'
+    elif since_date is not None:
+        where, params = 'WHERE vod_date >= ?', (vod_date_text(since_date),)
+    cursor = get_db(readonly=True).cursor().execute(f"""
+    SELECT id, url, p1_tag, c1_name, p2_tag, c2_name, event_name, round, CAST(vod_date AS TEXT)
+    FROM vod_listing
+    {where}
+    ORDER BY {order};
+    """, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def write_export(binary, rows, format):
+    """Write export rows to a binary file as CSV or NDJSON and return (rows written, last VOD id)."""
+    import csv
+    import io
+
+    text = io.TextIOWrapper(binary, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    count = 0
+    last_id = 0
+    for id, url, p1_tag, c1_name, p2_tag, c2_name, event_name, round, vod_date in rows:
+        row = [url, p1_tag, c1_name, p2_tag, c2_name, event_name, round if round else '', vod_date if vod_date else '']
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            text.write(json.dumps({'id': id, **dict(zip(EXPORT_FIELDS, row))}) + '\n')
+        count += 1
+        last_id = max(last_id, id)
+    text.flush()
+    text.detach()
+    return count, last_id
+
+def file_digest(filename, offset=0):
+    """Return the sha256 of a file from `offset` on."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 @click.command('export-vods')
 @click.argument('filename')
-def export_vods_command(filename):
-    import csv
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), default='csv', help='Write CSV rows like data/vods.csv, or a JSON object per line.')
+@click.option('--gzip', 'compressed', is_flag=True, help='gzip the output.')
+@click.option('--since-id', type=int, default=None, help='Only export VODs after this VOD id.')
+@click.option('--since-date', type=click.DateTime(['%Y-%m-%d']), default=None, help='Only export VODs from this date (YYYY-MM-DD) on.')
+@click.option('--append', is_flag=True, help='Add the VODs listed since the last export to FILENAME.')
+def export_vods_command(filename, format, compressed, since_id, since_date, append):
+    """Export the listed VODs to FILENAME, oldest first.
 
-    db = get_db()
-    vods = db.cursor().execute("""
-    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c2.name, e.name, vod.round, vod.vod_date
-    FROM vod
-        INNER JOIN event e ON e.id = vod.event_id
-        INNER JOIN player p1 ON p1.id = vod.p1_id
-        INNER JOIN player p2 ON p2.id = vod.p2_id
-        INNER JOIN game_character c1 ON c1.id = vod.c1_id
-        INNER JOIN game_character c2 ON c2.id = vod.c2_id
-    ORDER BY vod_date ASC
-    """, ()).fetchall()
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        vod_writer = csv.writer(csvfile)
-        for id, url, p1_tag, p2_tag, c1_name, c2_name, event_name, round, vod_date in vods:
-            row = [url, p1_tag, c1_name, p2_tag, c2_name, event_name, round if round else '', vod_date if vod_date else '']
-            vod_writer.writerow(row)
+    Rows are streamed from the database, so memory use doesn't grow with the
+    archive. FILENAME.manifest.json records the export: its format, how many
+    rows it has, the newest VOD id in it, and each part written with its byte
+    range, row count and sha256. --append adds a part with the VODs added
+    since, so keeping a mirror up to date only costs as much as what changed.
+    Removed or edited VODs need a full export to show up.
+    """
+    import gzip
+    import itertools
+
+    if since_id is not None and since_date is not None:
+        raise click.UsageError('Give --since-id or --since-date, not both.')
+    manifest_path = filename + '.manifest.json'
+    manifest = {'format': format, 'gzip': compressed, 'rows': 0, 'last_vod_id': 0, 'parts': []}
+    offset = 0
+    if append and os.path.exists(filename):
+        if not os.path.exists(manifest_path):
+            raise click.ClickException(f'{filename} has no manifest to append from, so export it in full first.')
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if (manifest['format'], manifest['gzip']) != (format, compressed):
+            raise click.ClickException(f"{filename} is {'gzipped ' if manifest['gzip'] else ''}{manifest['format']}, not {'gzipped ' if compressed else ''}{format}.")
+        offset = os.path.getsize(filename)
+        if offset != sum(part['bytes'] for part in manifest['parts']):
+            raise click.ClickException(f"{filename} doesn't match its manifest, so export it in full again.")
+        if since_id is None and since_date is None:
+            since_id = manifest['last_vod_id']
+
+    rows = export_rows(since_id, since_date)
+    first = next(rows, None)
+    if append and first is None:
+        click.echo(f'No new vods to add to {filename}.')
+        return
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    # A full export is written aside and renamed, so readers never see half of it.
+    path = filename if append else filename + '.tmp'
+    with open(path, 'ab' if append else 'wb') as f:
+        # Appended gzip parts are separate gzip members, which read back as one stream.
+        binary = gzip.GzipFile(fileobj=f, mode='wb', mtime=0) if compressed else f
+        rows, last_id = write_export(binary, rows, format)
+        if compressed:
+            binary.close()
+    size = os.path.getsize(path)
+    if not append:
+        os.replace(path, filename)
+
+    manifest['rows'] += rows
+    manifest['last_vod_id'] = max(manifest['last_vod_id'], last_id)
+    manifest['parts'].append({
+        'since_id': since_id,
+        'since_date': vod_date_text(since_date) or None,
+        'offset': offset,
+        'bytes': size - offset,
+        'rows': rows,
+        'last_vod_id': last_id,
+        'sha256': file_digest(filename, offset),
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    click.echo(f"Exported {rows} vods to {filename}, {manifest['rows']} in all.")
 
 def prompt(text, default=None):
     value = input(f'{text} ' + (f'[{default}]' if default else '') + ': ')
@@ -501,13 +2339,25 @@ def prompt(text, default=None):
     
 
 sqlite3.register_converter(
-    "timestamp", lambda v: datetime.fromisoformat(v.decode())
+    "timestamp", lambda v: datetime.fromisoformat(v.decode()) if v else None
 )
 
 def init_app(app):
+    for name in settings:
+        settings[name] = app.config.get(name, settings[name])
+    result_cache.maxsize = app.config.get('RESULT_CACHE_SIZE', result_cache.maxsize)
+    result_cache.ttl = app.config.get('RESULT_CACHE_TTL', result_cache.ttl)
+    if app.config.get('SLOW_QUERY_LOG'):
+        slow_query_log.addHandler(logging.FileHandler(app.config['SLOW_QUERY_LOG']))
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(check_plans_command)
+    app.cli.add_command(rebuild_search_command)
+    app.cli.add_command(rebuild_stats_command)
     app.cli.add_command(review_submissions_command)
     app.cli.add_command(ingest_channel_command)
+    app.cli.add_command(ingest_all_command)
     app.cli.add_command(ingest_csv_command)
+    app.cli.add_command(merge_duplicate_vods_command)
     app.cli.add_command(export_vods_command)
\ No newline at end of file
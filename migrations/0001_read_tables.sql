@@ -0,0 +1,248 @@
+-- Version 1: everything added to the schema before it was versioned.
+--
+-- Databases from before then have anywhere from none to all of these, so the
+-- tables holding state are only created if they're missing, and the tables
+-- derived from vod are dropped and created afresh. migrate_read_tables in
+-- db.py merges duplicate videos before this and refills the derived tables
+-- after.
+
+DROP TRIGGER IF EXISTS vod_listing_vod_insert;
+DROP TRIGGER IF EXISTS vod_listing_vod_delete;
+DROP TRIGGER IF EXISTS vod_listing_vod_update;
+DROP TRIGGER IF EXISTS vod_listing_player_update;
+DROP TRIGGER IF EXISTS vod_listing_player_delete;
+DROP TRIGGER IF EXISTS vod_listing_event_update;
+DROP TRIGGER IF EXISTS vod_listing_event_delete;
+DROP TRIGGER IF EXISTS vod_listing_character_update;
+DROP TRIGGER IF EXISTS write_generation_insert;
+DROP TRIGGER IF EXISTS write_generation_delete;
+DROP TRIGGER IF EXISTS write_generation_update;
+DROP TRIGGER IF EXISTS vod_search_insert;
+DROP TRIGGER IF EXISTS vod_search_delete;
+DROP TRIGGER IF EXISTS vod_search_update;
+DROP TRIGGER IF EXISTS stats_insert;
+DROP TRIGGER IF EXISTS stats_delete;
+DROP TABLE IF EXISTS vod_search;
+DROP TABLE IF EXISTS vod_listing;
+DROP TABLE IF EXISTS matchup_stats;
+DROP TABLE IF EXISTS player_stats;
+DROP TABLE IF EXISTS player_character_stats;
+DROP TABLE IF EXISTS head_to_head_stats;
+
+-- How far ingest-channel has got through each channel search. Runs only ask
+-- for videos published after `published_after`, and an interrupted walk
+-- picks up again from `page_token`.
+CREATE TABLE IF NOT EXISTS channel_sync (
+    channel_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    published_after TEXT,
+    page_token TEXT,
+    high_water TEXT,
+    updated_at TIMESTAMP,
+    PRIMARY KEY (channel_id, query)
+);
+
+-- Set for the length of a bulk load's transaction. The triggers below that
+-- maintain the read tables stand down while it's set, and the loader fills
+-- vod_listing and vod_search for its rows in one statement each instead.
+CREATE TABLE IF NOT EXISTS bulk_load (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    active INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO bulk_load (id, active) VALUES (1, 0);
+
+-- Flattened copy of each VOD with everything the pages and exports show, so
+-- reads don't have to join player, event and game_character. Only VODs whose
+-- event, players and characters all resolve get a row. Missing dates are
+-- stored as '' so (vod_date, id) always orders pages.
+CREATE TABLE vod_listing (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    event_id INTEGER NOT NULL,
+    p1_id INTEGER NOT NULL,
+    c1_id INTEGER NOT NULL,
+    p2_id INTEGER NOT NULL,
+    c2_id INTEGER NOT NULL,
+    p1_tag TEXT NOT NULL,
+    c1_name TEXT NOT NULL,
+    c1_icon_url TEXT,
+    p2_tag TEXT NOT NULL,
+    c2_name TEXT NOT NULL,
+    c2_icon_url TEXT,
+    event_name TEXT NOT NULL,
+    round TEXT,
+    vod_date TIMESTAMP NOT NULL,
+    FOREIGN KEY (id) REFERENCES vod (id)
+);
+
+CREATE INDEX idx_vod_listing_date ON vod_listing (vod_date DESC, id DESC);
+CREATE INDEX idx_vod_listing_event ON vod_listing (event_id);
+CREATE INDEX idx_vod_listing_p1 ON vod_listing (p1_id);
+CREATE INDEX idx_vod_listing_p2 ON vod_listing (p2_id);
+CREATE INDEX idx_vod_listing_c1 ON vod_listing (c1_id);
+CREATE INDEX idx_vod_listing_c2 ON vod_listing (c2_id);
+
+CREATE TRIGGER vod_listing_vod_insert AFTER INSERT ON vod
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    INSERT INTO vod_listing (id, url, event_id, p1_id, c1_id, p2_id, c2_id, p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url, event_name, round, vod_date)
+    SELECT new.id, new.url, e.id, p1.id, c1.id, p2.id, c2.id, p1.tag, c1.name, c1.icon_url, p2.tag, c2.name, c2.icon_url, e.name, new.round, COALESCE(new.vod_date, '')
+    FROM event e, player p1, player p2, game_character c1, game_character c2
+    WHERE e.id = new.event_id
+        AND p1.id = new.p1_id
+        AND p2.id = new.p2_id
+        AND c1.id = new.c1_id
+        AND c2.id = new.c2_id;
+END;
+
+CREATE TRIGGER vod_listing_vod_delete AFTER DELETE ON vod BEGIN
+    DELETE FROM vod_listing WHERE id = old.id;
+END;
+
+CREATE TRIGGER vod_listing_vod_update AFTER UPDATE ON vod BEGIN
+    DELETE FROM vod_listing WHERE id = old.id;
+    INSERT INTO vod_listing (id, url, event_id, p1_id, c1_id, p2_id, c2_id, p1_tag, c1_name, c1_icon_url, p2_tag, c2_name, c2_icon_url, event_name, round, vod_date)
+    SELECT new.id, new.url, e.id, p1.id, c1.id, p2.id, c2.id, p1.tag, c1.name, c1.icon_url, p2.tag, c2.name, c2.icon_url, e.name, new.round, COALESCE(new.vod_date, '')
+    FROM event e, player p1, player p2, game_character c1, game_character c2
+    WHERE e.id = new.event_id
+        AND p1.id = new.p1_id
+        AND p2.id = new.p2_id
+        AND c1.id = new.c1_id
+        AND c2.id = new.c2_id;
+END;
+
+CREATE TRIGGER vod_listing_player_update AFTER UPDATE OF tag ON player BEGIN
+    UPDATE vod_listing SET p1_tag = new.tag WHERE p1_id = new.id;
+    UPDATE vod_listing SET p2_tag = new.tag WHERE p2_id = new.id;
+END;
+
+CREATE TRIGGER vod_listing_player_delete AFTER DELETE ON player BEGIN
+    DELETE FROM vod_listing WHERE p1_id = old.id OR p2_id = old.id;
+END;
+
+CREATE TRIGGER vod_listing_event_update AFTER UPDATE OF name ON event BEGIN
+    UPDATE vod_listing SET event_name = new.name WHERE event_id = new.id;
+END;
+
+CREATE TRIGGER vod_listing_event_delete AFTER DELETE ON event BEGIN
+    DELETE FROM vod_listing WHERE event_id = old.id;
+END;
+
+CREATE TRIGGER vod_listing_character_update AFTER UPDATE OF name, icon_url ON game_character BEGIN
+    UPDATE vod_listing SET c1_name = new.name, c1_icon_url = new.icon_url WHERE c1_id = new.id;
+    UPDATE vod_listing SET c2_name = new.name, c2_icon_url = new.icon_url WHERE c2_id = new.id;
+END;
+
+-- Bumped whenever vod_listing changes, so anything caching VOD pages can tell
+-- when it's stale.
+CREATE TABLE IF NOT EXISTS write_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+INSERT OR IGNORE INTO write_generation (id, generation, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP);
+
+CREATE TRIGGER write_generation_insert AFTER INSERT ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    UPDATE write_generation SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER write_generation_delete AFTER DELETE ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    UPDATE write_generation SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER write_generation_update AFTER UPDATE ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    UPDATE write_generation SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+-- Trigram index for substring search, stored against vod_listing.
+CREATE VIRTUAL TABLE vod_search USING fts5(
+    p1_tag,
+    p2_tag,
+    c1_name,
+    c2_name,
+    event_name,
+    round,
+    content = 'vod_listing',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER vod_search_insert AFTER INSERT ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    INSERT INTO vod_search (rowid, p1_tag, p2_tag, c1_name, c2_name, event_name, round)
+    VALUES (new.id, new.p1_tag, new.p2_tag, new.c1_name, new.c2_name, new.event_name, new.round);
+END;
+
+CREATE TRIGGER vod_search_delete AFTER DELETE ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    INSERT INTO vod_search (vod_search, rowid, p1_tag, p2_tag, c1_name, c2_name, event_name, round)
+    VALUES ('delete', old.id, old.p1_tag, old.p2_tag, old.c1_name, old.c2_name, old.event_name, old.round);
+END;
+
+CREATE TRIGGER vod_search_update AFTER UPDATE ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    INSERT INTO vod_search (vod_search, rowid, p1_tag, p2_tag, c1_name, c2_name, event_name, round)
+    VALUES ('delete', old.id, old.p1_tag, old.p2_tag, old.c1_name, old.c2_name, old.event_name, old.round);
+    INSERT INTO vod_search (rowid, p1_tag, p2_tag, c1_name, c2_name, event_name, round)
+    VALUES (new.id, new.p1_tag, new.p2_tag, new.c1_name, new.c2_name, new.event_name, new.round);
+END;
+
+-- Running VOD counts for the stats page, kept up to date from vod_listing.
+-- Matchups and head-to-heads are stored once per pair, lowest ID first.
+CREATE TABLE matchup_stats (
+    c1_id INTEGER NOT NULL,
+    c2_id INTEGER NOT NULL,
+    vods INTEGER NOT NULL,
+    PRIMARY KEY (c1_id, c2_id)
+);
+
+CREATE TABLE player_stats (
+    player_id INTEGER PRIMARY KEY,
+    vods INTEGER NOT NULL,
+    FOREIGN KEY (player_id) REFERENCES player (id)
+);
+
+CREATE TABLE player_character_stats (
+    player_id INTEGER NOT NULL,
+    character_id INTEGER NOT NULL,
+    vods INTEGER NOT NULL,
+    PRIMARY KEY (player_id, character_id)
+);
+
+CREATE TABLE head_to_head_stats (
+    p1_id INTEGER NOT NULL,
+    p2_id INTEGER NOT NULL,
+    vods INTEGER NOT NULL,
+    PRIMARY KEY (p1_id, p2_id)
+);
+
+CREATE INDEX idx_player_stats_vods ON player_stats (vods DESC);
+CREATE INDEX idx_head_to_head_stats_vods ON head_to_head_stats (vods DESC);
+
+CREATE TRIGGER stats_insert AFTER INSERT ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    INSERT INTO matchup_stats (c1_id, c2_id, vods) VALUES (min(new.c1_id, new.c2_id), max(new.c1_id, new.c2_id), 1)
+    ON CONFLICT (c1_id, c2_id) DO UPDATE SET vods = vods + 1;
+    INSERT INTO player_stats (player_id, vods) SELECT new.p1_id, 1 UNION SELECT new.p2_id, 1 WHERE true
+    ON CONFLICT (player_id) DO UPDATE SET vods = vods + 1;
+    INSERT INTO player_character_stats (player_id, character_id, vods) SELECT new.p1_id, new.c1_id, 1 UNION SELECT new.p2_id, new.c2_id, 1 WHERE true
+    ON CONFLICT (player_id, character_id) DO UPDATE SET vods = vods + 1;
+    INSERT INTO head_to_head_stats (p1_id, p2_id, vods) VALUES (min(new.p1_id, new.p2_id), max(new.p1_id, new.p2_id), 1)
+    ON CONFLICT (p1_id, p2_id) DO UPDATE SET vods = vods + 1;
+END;
+
+CREATE TRIGGER stats_delete AFTER DELETE ON vod_listing
+WHEN (SELECT active FROM bulk_load) = 0 BEGIN
+    UPDATE matchup_stats SET vods = vods - 1 WHERE c1_id = min(old.c1_id, old.c2_id) AND c2_id = max(old.c1_id, old.c2_id);
+    UPDATE player_stats SET vods = vods - 1 WHERE player_id IN (old.p1_id, old.p2_id);
+    UPDATE player_character_stats SET vods = vods - 1 WHERE (player_id, character_id) IN (VALUES (old.p1_id, old.c1_id), (old.p2_id, old.c2_id));
+    UPDATE head_to_head_stats SET vods = vods - 1 WHERE p1_id = min(old.p1_id, old.p2_id) AND p2_id = max(old.p1_id, old.p2_id);
+    DELETE FROM matchup_stats WHERE vods <= 0;
+    DELETE FROM player_stats WHERE vods <= 0;
+    DELETE FROM player_character_stats WHERE vods <= 0;
+    DELETE FROM head_to_head_stats WHERE vods <= 0;
+END;
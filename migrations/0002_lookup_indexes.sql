@@ -0,0 +1,5 @@
+-- Version 2: ensure_player and ensure_event look players and events up by
+-- name. migrate_lookup_indexes in db.py merges any duplicates first.
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_player_tag ON player (tag);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_event_name ON event (name);
@@ -0,0 +1,56 @@
+-- Version 3: searches on players and events find which ones a term matches
+-- in player_search and event_search, then read their VODs off vod_listing's
+-- (p1_id / p2_id / event_id, vod_date, id) indexes. Matchup searches read
+-- theirs off (c1_id, c2_id, vod_date, id).
+
+DROP INDEX IF EXISTS idx_vod_listing_event;
+DROP INDEX IF EXISTS idx_vod_listing_p1;
+DROP INDEX IF EXISTS idx_vod_listing_p2;
+DROP INDEX IF EXISTS idx_vod_listing_c1;
+CREATE INDEX idx_vod_listing_event ON vod_listing (event_id, vod_date DESC, id DESC);
+CREATE INDEX idx_vod_listing_p1 ON vod_listing (p1_id, vod_date DESC, id DESC);
+CREATE INDEX idx_vod_listing_p2 ON vod_listing (p2_id, vod_date DESC, id DESC);
+CREATE INDEX idx_vod_listing_c1 ON vod_listing (c1_id, c2_id, vod_date DESC, id DESC);
+
+CREATE VIRTUAL TABLE player_search USING fts5(
+    tag,
+    content = 'player',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER player_search_insert AFTER INSERT ON player BEGIN
+    INSERT INTO player_search (rowid, tag) VALUES (new.id, new.tag);
+END;
+
+CREATE TRIGGER player_search_delete AFTER DELETE ON player BEGIN
+    INSERT INTO player_search (player_search, rowid, tag) VALUES ('delete', old.id, old.tag);
+END;
+
+CREATE TRIGGER player_search_update AFTER UPDATE OF tag ON player BEGIN
+    INSERT INTO player_search (player_search, rowid, tag) VALUES ('delete', old.id, old.tag);
+    INSERT INTO player_search (rowid, tag) VALUES (new.id, new.tag);
+END;
+
+CREATE VIRTUAL TABLE event_search USING fts5(
+    name,
+    content = 'event',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER event_search_insert AFTER INSERT ON event BEGIN
+    INSERT INTO event_search (rowid, name) VALUES (new.id, new.name);
+END;
+
+CREATE TRIGGER event_search_delete AFTER DELETE ON event BEGIN
+    INSERT INTO event_search (event_search, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+
+CREATE TRIGGER event_search_update AFTER UPDATE OF name ON event BEGIN
+    INSERT INTO event_search (event_search, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO event_search (rowid, name) VALUES (new.id, new.name);
+END;
+
+INSERT INTO player_search (player_search) VALUES ('rebuild');
+INSERT INTO event_search (event_search) VALUES ('rebuild');
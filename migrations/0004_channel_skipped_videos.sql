@@ -0,0 +1,11 @@
+-- Version 4: ingest-channel and ingest-all keep the videos they couldn't add,
+-- so later runs, which only fetch newer videos, can try them again.
+
+CREATE TABLE IF NOT EXISTS channel_skipped_video (
+    channel_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    PRIMARY KEY (channel_id, query, video_id)
+);
@@ -12,7 +12,35 @@ class Vod:
     round: str
     vod_date: datetime
 
-@dataclass
+@dataclass(frozen=True)
+class VodPage:
+    vods: tuple
+    next_cursor: str
+    prev_cursor: str
+
+@dataclass(frozen=True)
 class Channel:
     url: str
-    name: str
\ No newline at end of file
+    name: str
+
+@dataclass(frozen=True)
+class PlayerStats:
+    tag: str
+    vods: int
+    # (character name, vods) for their most-played characters.
+    characters: tuple
+
+@dataclass(frozen=True)
+class HeadToHead:
+    p1_tag: str
+    p2_tag: str
+    vods: int
+
+@dataclass(frozen=True)
+class Stats:
+    total_vods: int
+    characters: tuple
+    # matchups[i][j] is the number of VODs of characters[i] vs. characters[j].
+    matchups: tuple
+    players: tuple
+    head_to_heads: tuple
\ No newline at end of file
@@ -0,0 +1,38 @@
+import bisect
+
+def fold(text):
+    return ' '.join(text.casefold().split())
+
+class PrefixIndex:
+    """Sorted index of names answering prefix lookups with a binary search.
+
+    Names are case-folded and indexed from the start of every word, so sponsor
+    prefixes don't get in the way: "evil", "narduar" and "nng | evil" all find
+    "NNG | Evil Narduar".
+    """
+
+    def __init__(self, names=()):
+        entries = set()
+        for name in names:
+            words = fold(name).split(' ')
+            for i, word in enumerate(words):
+                if word and word != '|':
+                    entries.add((' '.join(words[i:]), name))
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.names = [name for _, name in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=10):
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        results = []
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(results) < limit and self.keys[i].startswith(prefix):
+            if self.names[i] not in results:
+                results.append(self.names[i])
+            i += 1
+        return results
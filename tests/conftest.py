@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app reads its settings from FLASK_ environment variables when it's imported.
+workdir = tempfile.mkdtemp(prefix='vods-tests-')
+os.environ['FLASK_DATABASE'] = os.path.join(workdir, 'database.db')
+os.environ['FLASK_SUBMISSION_SPOOL_DIR'] = os.path.join(workdir, 'submission_spool')
+os.environ['FLASK_RESULT_CACHE_SIZE'] = '0'
+os.environ['FLASK_PAGE_CACHE_SIZE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import db
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh database and spool directory, with this thread's connection to it."""
+    monkeypatch.setitem(db.settings, 'DATABASE', str(tmp_path / 'database.db'))
+    monkeypatch.setitem(db.settings, 'SUBMISSION_SPOOL_DIR', str(tmp_path / 'submission_spool'))
+    monkeypatch.setitem(db.settings, 'SUBMISSION_FLUSH_SECONDS', 0)
+    with app.app_context():
+        db.init_db()
+        yield db.get_db()
+    db.close_connections()
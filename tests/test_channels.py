@@ -0,0 +1,35 @@
+import youtube
+
+from app import app
+import db
+
+ITEMS = [
+    {'id': {'videoId': 'aaaaaaaaaaa'}, 'snippet': {'title': 'Ev - Alpha (Kragg) vs Beta (Fleet)', 'publishedAt': '2025-01-01T00:00:00Z'}},
+    {'id': {'videoId': 'bbbbbbbbbbb'}, 'snippet': {'title': 'Gamma (Kragg) vs Delta (Fleet) @ Ev', 'publishedAt': '2025-01-02T00:00:00Z'}},
+]
+
+def search_stub(url):
+    # Everything has been published by the time the second run asks for newer videos.
+    return {'items': [] if 'publishedAfter' in url else ITEMS}
+
+def write_queries(path, formats):
+    path.write_text(''.join(f"Ev: flask ingest-channel UC1 'q' \"{format}\"\n" for format in formats), encoding='utf-8')
+
+def listed_urls(database):
+    return [url for url, in database.execute('SELECT url FROM vod_listing ORDER BY url;')]
+
+def test_ingest_all_picks_up_skipped_titles_once_their_format_is_added(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'youtube_client', lambda *args: youtube.YouTubeClient('key', http_get=search_stub))
+    queries = tmp_path / 'regular_queries.txt'
+    runner = app.test_cli_runner()
+
+    write_queries(queries, ['%E - %P1 (%C1) %V %P2 (%C2)'])
+    result = runner.invoke(args=['ingest-all', str(queries)])
+    assert result.exit_code == 0, result.output
+    assert listed_urls(database) == ['https://www.youtube.com/watch?v=aaaaaaaaaaa']
+
+    write_queries(queries, ['%E - %P1 (%C1) %V %P2 (%C2)', '%P1 (%C1) %V %P2 (%C2) @ %E'])
+    result = runner.invoke(args=['ingest-all', str(queries)])
+    assert result.exit_code == 0, result.output
+    assert listed_urls(database) == ['https://www.youtube.com/watch?v=aaaaaaaaaaa', 'https://www.youtube.com/watch?v=bbbbbbbbbbb']
+    assert database.execute('SELECT count(*) FROM channel_skipped_video;').fetchone()[0] == 0
@@ -0,0 +1,47 @@
+import json
+import os
+import time
+
+from app import app
+import db
+
+SUBMISSION = ['https://www.youtube.com/watch?v=aaaaaaaaaaa', 'Kragg', 'Fleet', 'A&amp;B', 'C', 'Rock &amp; Roll', 'Grand Finals', '01/02/25']
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+def spooled(queue):
+    with open(os.path.join(queue.spool_dir, f'{queue.pid}.jsonl'), encoding='utf-8') as f:
+        return [json.loads(line).get('submission') for line in f]
+
+def submission_count():
+    return db.connect().execute('SELECT count(*) FROM submission;').fetchone()[0]
+
+def test_queue_keeps_submissions_while_the_database_refuses_them(database):
+    database.execute('DROP TABLE submission;')
+    database.commit()
+    queue = db.SubmissionQueue()
+    assert queue.put(SUBMISSION)
+    time.sleep(0.5)
+    assert spooled(queue) == [SUBMISSION]
+    assert not os.path.exists(os.path.join(queue.spool_dir, 'dead.jsonl'))
+
+    db.init_db()
+    wait_for(lambda: submission_count() == 1)
+    wait_for(lambda: spooled(queue) == [])
+
+def test_batch_and_interactive_review_store_the_same_names(database):
+    db.insert_submissions(database, [SUBMISSION])
+    database.commit()
+    db.review_submissions_batch({**db.REVIEW_RULES, 'require_known_channel': False}, client=None)
+
+    db.insert_submissions(database, [['https://www.youtube.com/watch?v=bbbbbbbbbbb', *SUBMISSION[1:]]])
+    database.commit()
+    result = app.test_cli_runner().invoke(args=['review-submissions'], input='a\n')
+    assert result.exit_code == 0, result.output
+
+    assert [tuple(row) for row in database.execute('SELECT p1_tag, event_name FROM vod_listing;')] == [('A&B', 'Rock & Roll')] * 2
+    assert [tag for tag, in database.execute('SELECT tag FROM player ORDER BY tag;')] == ['A&B', 'C']
@@ -0,0 +1,58 @@
+import re
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_HOSTS = {'youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com'}
+TWITCH_HOSTS = {'twitch.tv', 'm.twitch.tv', 'player.twitch.tv', 'clips.twitch.tv'}
+YOUTUBE_ID = re.compile(r'^[\w-]{11}$')
+YOUTUBE_PATH = re.compile(r'^/(?:embed|shorts|live|v)/([\w-]{11})')
+TWITCH_VIDEO_PATH = re.compile(r'^/(?:videos|[^/]+/v(?:ideo)?)/v?(\d+)')
+TWITCH_CLIP_PATH = re.compile(r'^/(?:[^/]+/clip/)?([\w-]+)$')
+# The form nearly every stored URL already has.
+PLAIN_YOUTUBE_URL = re.compile(r'^https://www\.youtube\.com/watch\?v=([\w-]{11})$')
+
+def canonical_video_key(url):
+    """Return the (platform, video_id) a VOD URL points at.
+
+    YouTube watch, youtu.be, embed, shorts and live links all give
+    ('youtube', id), and a playlist gives ('youtube-playlist', id). Twitch
+    VODs give ('twitch', id) and clips ('twitch-clip', slug). Timestamps and
+    other parameters are ignored. Anything else is keyed as ('url', ...) with
+    the scheme, www., fragment and trailing slash dropped.
+    """
+    url = (url or '').strip()
+    match = PLAIN_YOUTUBE_URL.match(url)
+    if match:
+        return 'youtube', match.group(1)
+    parsed = urlparse(url if '//' in url else '//' + url)
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = parse_qs(parsed.query)
+
+    if host in YOUTUBE_HOSTS:
+        video_id = (query.get('v') or [''])[0]
+        if YOUTUBE_ID.match(video_id):
+            return 'youtube', video_id
+        match = YOUTUBE_PATH.match(parsed.path)
+        if match:
+            return 'youtube', match.group(1)
+        if parsed.path.rstrip('/') == '/playlist' and query.get('list'):
+            return 'youtube-playlist', query['list'][0]
+    elif host == 'youtu.be':
+        video_id = parsed.path.strip('/')
+        if YOUTUBE_ID.match(video_id):
+            return 'youtube', video_id
+    elif host in TWITCH_HOSTS:
+        video_id = (query.get('video') or [''])[0].lstrip('v')
+        if host == 'player.twitch.tv' and video_id.isdigit():
+            return 'twitch', video_id
+        match = TWITCH_VIDEO_PATH.match(parsed.path)
+        if match:
+            return 'twitch', match.group(1)
+        if host == 'clips.twitch.tv' or '/clip/' in parsed.path:
+            match = TWITCH_CLIP_PATH.match(parsed.path.rstrip('/'))
+            if match:
+                return 'twitch-clip', match.group(1)
+
+    path = parsed.path.rstrip('/')
+    return 'url', host + path + ('?' + parsed.query if parsed.query else '')
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+API_URL = 'https://www.googleapis.com/youtube/v3'
+
+def urllib_get(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+class YouTubeClient:
+    """Minimal YouTube Data API client for channel searches.
+
+    `http_get` takes a URL and returns the decoded JSON, so tests can swap in
+    a stub, and `api_url` can point at a local stub server. With `cache_dir`
+    every response is saved to disk, and with `offline` responses only come
+    from there, so a run can be replayed without the API.
+    """
+
+    def __init__(self, api_key, api_url=API_URL, http_get=urllib_get, cache_dir=None, offline=False):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.http_get = http_get
+        self.cache_dir = cache_dir
+        self.offline = offline
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def search_page(self, channel_id, query, page_token=None, published_after=None):
+        params = {
+            'part': 'snippet',
+            'maxResults': 50,
+            'channelId': channel_id,
+            'q': query,
+        }
+        if page_token:
+            params['pageToken'] = page_token
+        if published_after:
+            params['publishedAfter'] = published_after
+        return self.get('search', params)
+
+    def videos(self, video_ids):
+        """Return {video_id: snippet} for the videos that exist, 50 per request."""
+        snippets = {}
+        video_ids = list(dict.fromkeys(video_ids))
+        for i in range(0, len(video_ids), 50):
+            page = self.get('videos', {'part': 'snippet', 'id': ','.join(video_ids[i:i + 50])})
+            for item in page.get('items') or []:
+                snippets[item['id']] = item['snippet']
+        return snippets
+
+    def get(self, endpoint, params):
+        url = f'{self.api_url}/{endpoint}?{urllib.parse.urlencode(params)}'
+
+        # The key isn't part of the cache key, so cached runs replay without one.
+        cache_path = None
+        if self.cache_dir:
+            cache_path = os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + '.json')
+            if os.path.exists(cache_path):
+                with open(cache_path, encoding='utf-8') as f:
+                    return json.load(f)
+        if self.offline:
+            raise LookupError(f'No cached response for {url}')
+
+        page = self.http_get(url + '&' + urllib.parse.urlencode({'key': self.api_key}))
+        if cache_path:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(page, f)
+        return page
+
+@dataclass
+class ChannelFetch:
+    channel_id: str
+    query: str
+    # Search result items, in the order the API returned them.
+    items: list
+    # Newest publishedAt among the items, or the previous high-water mark.
+    high_water: str
+    # Page the walk stopped at if `error` is set. None means the first page.
+    resume_token: str
+    error: Exception = None
+
+def fetch_channel(client, channel_id, query, published_after=None, page_token=None):
+    """Walk a channel's search results published after `published_after`.
+
+    Errors stop the walk rather than raise, and the returned ChannelFetch
+    holds everything fetched up to that point plus the page to resume from.
+    """
+    items = []
+    high_water = published_after
+    while True:
+        try:
+            page = client.search_page(channel_id, query, page_token, published_after)
+        except Exception as e:
+            return ChannelFetch(channel_id, query, items, high_water, page_token, e)
+        for item in page.get('items') or []:
+            items.append(item)
+            published_at = item.get('snippet', {}).get('publishedAt')
+            if published_at and (not high_water or published_at > high_water):
+                high_water = published_at
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return ChannelFetch(channel_id, query, items, high_water, None)
+
+def fetch_channels(client, jobs, max_workers=8):
+    """Run fetch_channel for many (channel_id, query, published_after, page_token) jobs at once."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda job: fetch_channel(client, *job), jobs))
+
+@lru_cache(maxsize=None)
+def title_format_regex(format):
+    """Compile an ingest-channel title format (%P1, %C1, %E, ...) into a regex."""
+    format_regex_str = (re.escape(format)
+                    .replace('%SIDE', '(([\\s*W\\s*])|([\\s*L\\s*]))')
+                    .replace('%E', '(?P<event>[\\s*#*\\(*\\s*\\w~#&;\\-:\\)*]+)')
+                    .replace('%P1', '(?P<p1>[\\s*\\w\\$|&;~!?#.@\\-\\+]+)')
+                    .replace('%P2', '(?P<p2>[\\s*\\w\\$|&;~!?#.@\\-\\+]+)')
+                    .replace('%C1', '(?P<c1>[\\s*\\w/*,*]+)')
+                    .replace('%C2', '(?P<c2>[\\s*\\w/*,*]+)')
+                    .replace('%V', '((vs.)|(vs)|(Vs.)|(VS.)|(Vs)|(VS))')
+                    .replace('%ROA', '((RoA2)|(ROA2)|(Rivals II)|(Rivals 2)|(Rivals of Aether 2)|(Rivals of Aether II)|(Rivals II Bracket)|(Rivals 2 Bracket))?')
+                    .replace('%R', '(?P<round>[\\s*\\(*\\s*\\w\\-#&;\\)*]+)'))
+    return re.compile(format_regex_str)
+
+def read_regular_queries(filename):
+    """Read the ingest-channel invocations in a regular queries file.
+
+    Lines look like `Name: flask ingest-channel <channel_id> '<query>' "<format>"`.
+    Returns {(channel_id, query): [format, ...]} in file order.
+    """
+    import shlex
+
+    queries = {}
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if 'ingest-channel' not in line:
+                continue
+            command = shlex.split(line[line.index('flask ingest-channel'):])
+            channel_id, query, format = command[2:5]
+            formats = queries.setdefault((channel_id, query), [])
+            if format not in formats:
+                formats.append(format)
+    return queries
+
+def read_channel_ids(filename):
+    """Read a channel list like data/channel_ids.txt.
+
+    Lines look like `<url>: <channel_id> <name>`. Returns
+    [(url, channel_id, name), ...] in file order.
+    """
+    channels = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if ': ' not in line:
+                continue
+            url, rest = line.strip().split(': ', 1)
+            channel_id, _, name = rest.partition(' ')
+            channels.append((url, channel_id, name))
+    return channels
+
+def parse_title(format_regex, title):
+    """Return the players, characters, event and round in a video title, or None if it doesn't match.
+
+    Characters the format doesn't capture come back as None.
+    """
+    info = format_regex.match(title.strip())
+    if not info or not info.groupdict().get('p1') or not info.groupdict().get('p2'):
+        return None
+
+    def character(group):
+        if not info.groupdict().get(group):
+            return None
+        return info.group(group).lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
+
+    return {
+        'p1': info.group('p1'),
+        'p2': info.group('p2'),
+        'c1': character('c1'),
+        'c2': character('c2'),
+        'event': info.groupdict().get('event') or 'Unknown',
+        'round': info.groupdict().get('round') or '',
+    }